@@ -2,55 +2,112 @@ import discord
 from discord.ext import commands
 import random
 import json
+import math
 import asyncio
 import os
+import time
 from dotenv import load_dotenv
-from datetime import datetime
-from prettytable import PrettyTable
-from pymongo import MongoClient
-from flask import Flask
-import threading
-import asyncio
+from datetime import datetime, timezone
+import database
+from catalog import card_catalog
+from leaderboard import leaderboard
+from battles import battle_registry
+from checkpoints import checkpoint_writer
+from dispatcher import InvalidInput, hand_index, message_router
+from delivery import delivery
+from models import ROUNDS, STAT_FIELDS, Card, UserProfile, challenger_wins_round
+from results import WIN_POINTS, result_writer
+from metrics import metrics
+from webserver import StatusServer
+from coordination import PROCESS_ID, SHARD_COUNT, SHARD_IDS, coordinator
+from ratelimit import RateLimited, coalesced, coalescer, command_limiter
+from matchmaking import matchmaking_queue
+from eventlog import event_log
+from embeds import card_detail_embed, card_summary_embed, embed_cache, team_card_embed, team_grid
+import signal
+import traceback
 
 load_dotenv()
 
 
-port = os.getenv('PORT', 5000) 
-app = Flask(__name__)
 intents = discord.Intents.default()
 intents.members = True
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
 
 
-MONGO_URI = os.getenv("MONGO_URI")
+# Sharded deployments run several processes, each owning the SHARD_IDS slice of SHARD_COUNT shards.
+BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+
+
+class SarangiBot(BotBase):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.status_server = StatusServer(is_ready=lambda: self.is_ready() and card_catalog.loaded)
+
+    async def setup_hook(self):
+        timings = await warm_up()
+        start = time.perf_counter()
+        await self.status_server.start()
+        timings["status_server"] = time.perf_counter() - start
+        print("Startup timings: " + ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items()))
+
+        coordinator.subscribe(on_forwarded_accept, on_forwarded_message, on_cache_event)
+        await coordinator.start()
+        battle_registry.start(on_expired=discard_checkpoints)
+        matchmaking_queue.start(on_match=start_matches, on_expired=notify_queue_expired)
+        checkpoint_writer.start()
+        result_writer.start()
+        event_log.start()
+        metrics.start()
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            pass
+
+    async def close(self):
+        """Flush buffered battle writes and stop the status server before disconnecting."""
+        battle_registry.stop()
+        matchmaking_queue.stop()
+        metrics.stop()
+        for error in await asyncio.gather(
+            result_writer.stop(), checkpoint_writer.stop(), event_log.stop(), return_exceptions=True
+        ):
+            if isinstance(error, Exception):
+                print(f"Error flushing on shutdown: {error}")
+        await self.status_server.stop()
+        await coordinator.stop()
+        await team_grid.close()
+        database.close()
+        await super().close()
+
+
+if SHARD_COUNT:
+    bot = SarangiBot(command_prefix='!', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = SarangiBot(command_prefix='!', intents=intents)
+
+
 DISCORD_BOT_TOKEN = os.getenv("DISCORD_BOT_TOKEN")
-client = MongoClient(MONGO_URI)
-db = client["beingSarangi"] 
-users_collection = db.users  
-available_cards_collection = db.available_cards
 
-collections = db.list_collection_names()
-print(f"Collections in database: {collections}")
+MAX_DAILY_ROLLS = 2
+CARD_CLAIM_ATTEMPTS = 5
+battles_recovered = False
+SELECTION_TIMEOUT = 120.0
+ROUND_TIMEOUT = 200.0
+TEAM_PAGE_SIZE = 30
+# Send !team as one composited image per page instead of one embed per card (needs Pillow).
+TEAM_GRID = os.getenv("TEAM_GRID", "").lower() in ("1", "true", "yes") and team_grid.available
 
-active_battles = []
+card_catalog.listeners.append(embed_cache.catalog_changed)
+leaderboard.listeners.append(lambda: asyncio.ensure_future(share_cache_event("leaderboard")))
 
 async def send_card_images(user, selected_cards):
-    """Send each card as a separate embed."""
-    for card in selected_cards:
-        embed = discord.Embed(
-            title=f"{card.get('name')}",
-            description=f"Rating: {card.get('rating')}",
-            color=discord.Color.blue()
-        )
-        image_url = card.get('image_url')
-        if image_url:
-            embed.set_image(url=image_url)
-        await user.send(embed=embed)
+    """Send the cards as embeds, packed up to ten per message."""
+    await delivery.send_embeds(user, [card_summary_embed(card) for card in selected_cards])
 
 async def send_card(user, card_name):
     """Retrieve and send card information from MongoDB."""
-    user_data = users_collection.find_one({"user_id": str(user.id)}) 
+    user_data = await database.find_user(str(user.id))
 
     if not user_data:
         await user.send("Sorry, user data not found.")
@@ -66,97 +123,235 @@ async def send_card(user, card_name):
         await user.send(f"Sorry, I couldn't find any information for the card '{card_name}'.")
         return
 
-    embed = discord.Embed(
-        title=found_card["name"],
-        description=(
-            f"Rating: {found_card['rating']}\n"
-            f"Price: {found_card['price']}\n"
-            f"AGR: {found_card['agr']}\n"
-            f"Apps: {found_card.get('APPS', 'N/A')}"
-        ),
-        color=discord.Color.blue()
-    )
+    await delivery.send(user, embeds=[card_detail_embed(found_card)])
+
+metrics.register("sarangi_active_battles", lambda: battle_registry.stats()["active"])
+metrics.register("sarangi_expired_battles_total", lambda: battle_registry.stats()["expired"], "counter")
+metrics.register("sarangi_completed_battles_total", lambda: battle_registry.stats()["completed"], "counter")
+metrics.register("sarangi_dm_messages_sent_total", lambda: delivery.sent_count, "counter")
+metrics.register("sarangi_dm_rate_limited_total", lambda: delivery.rate_limited_count, "counter")
+metrics.register("sarangi_catalog_cards", lambda: len(card_catalog))
+metrics.register("sarangi_commands_shed_user_total", lambda: command_limiter.shed_count["user"], "counter")
+metrics.register("sarangi_commands_shed_guild_total", lambda: command_limiter.shed_count["guild"], "counter")
+metrics.register("sarangi_commands_coalesced_total", lambda: coalescer.coalesced_count, "counter")
+metrics.register("sarangi_queue_waiting", lambda: len(matchmaking_queue))
+metrics.register("sarangi_queue_matched_total", lambda: matchmaking_queue.matched_count, "counter")
+for quantile in ("p50", "p90", "p99"):
+    metrics.register(f"sarangi_queue_wait_{quantile}_seconds", lambda quantile=quantile: matchmaking_queue.wait_percentiles()[quantile])
+metrics.register("sarangi_events_written_total", lambda: event_log.written_count, "counter")
+metrics.register("sarangi_events_dropped_total", lambda: event_log.dropped_count, "counter")
+metrics.register("sarangi_embed_cache_entries", lambda: len(embed_cache))
+metrics.register("sarangi_embed_cache_hits_total", lambda: embed_cache.hits, "counter")
+metrics.register("sarangi_embed_cache_misses_total", lambda: embed_cache.misses, "counter")
+
+# check_once runs for the invoked command only; plain checks also run for every
+# command !help lists, which would spend tokens on commands nobody invoked.
+@bot.check_once
+async def rate_limit(ctx):
+    return command_limiter.check(ctx)
 
-    image_url = found_card.get("image_url")
-    if image_url:
-        embed.set_image(url=image_url)
-
-    await user.send(embed=embed)
+@bot.event
+async def on_command_error(ctx, error):
+    if isinstance(error, RateLimited):
+        # Tell a spammy user once; further shed requests are dropped silently.
+        if error.warn:
+            await ctx.send(f"{ctx.author.mention}, slow down! Try again in {error.retry_after:.0f}s.")
+        return
+    print(f"Ignoring exception in command {ctx.command}:")
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    metrics.observe_command(ctx.command.qualified_name, time.perf_counter() - ctx.started_at)
+    if ctx.command_failed:
+        metrics.inc("sarangi_command_errors_total")
+
+async def warm_up():
+    """Connect to Mongo and warm the indexes and card catalog in parallel; returns per-phase timings."""
+    timings = {}
+
+    async def timed(phase, coro):
+        phase_start = time.perf_counter()
+        await coro
+        timings[phase] = time.perf_counter() - phase_start
+
+    start = time.perf_counter()
+    database.connect()
+    timings["connect"] = time.perf_counter() - start
+    await asyncio.gather(
+        timed("indexes", database.ensure_indexes()),
+        timed("catalog", card_catalog.load())
+    )
+    timings["warm_up"] = time.perf_counter() - start
+    print(f"Loaded {len(card_catalog)} available cards into the catalog.")
+    return timings
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
+    # on_ready fires again after reconnects; only the first one follows a restart.
+    global battles_recovered
+    if not battles_recovered:
+        battles_recovered = True
+        await recover_battles()
+
+def discard_checkpoints(battles):
+    for battle in battles:
+        checkpoint_writer.discard(battle['battle_id'])
+        asyncio.ensure_future(coordinator.release(battle['battle_id']))
+
+def finish_battle(battle, completed):
+    if completed:
+        battle_registry.complete(battle['battle_id'])
+    else:
+        battle_registry.cancel(battle['battle_id'])
+    checkpoint_writer.discard(battle['battle_id'])
+    asyncio.ensure_future(coordinator.release(battle['battle_id']))
+
+async def resolve_user(user_id):
+    """Cached user if this process has seen them, otherwise fetched over REST (e.g. from another shard)."""
+    return bot.get_user(int(user_id)) or await bot.fetch_user(int(user_id))
+
+async def recover_battles():
+    """Restore pending challenges and cancel battles that were in flight when the bot stopped."""
+    checkpoints = await database.find_battle_checkpoints(PROCESS_ID)
+    restored_ids = []
+    for checkpoint in checkpoints:
+        age = (datetime.now(timezone.utc) - checkpoint["t"].replace(tzinfo=timezone.utc)).total_seconds()
+
+        if checkpoint["st"] == "pending" and age < battle_registry.ttl:
+            userA_data, userB_data = await asyncio.gather(
+                database.find_user(checkpoint["a"]),
+                database.find_user(checkpoint["b"])
+            )
+            userA_cards = [card for card in Card.from_documents((userA_data or {}).get("cards", [])) if card.id in checkpoint["ha"]]
+            userB_cards = [card for card in Card.from_documents((userB_data or {}).get("cards", [])) if card.id in checkpoint["hb"]]
+            if len(userA_cards) == len(checkpoint["ha"]) and len(userB_cards) == len(checkpoint["hb"]):
+                restored = battle_registry.create(
+                    checkpoint["a"], checkpoint["b"], userA_cards, userB_cards,
+                    battle_id=checkpoint["_id"], age=age
+                )
+                if restored:
+                    restored["channel_id"] = checkpoint.get("c")
+                    restored_ids.append(restored["battle_id"])
+                    await coordinator.claim(restored, restored["channel_id"])
+                    continue
+
+        checkpoint_writer.discard(checkpoint["_id"])
+        if checkpoint["st"] != "pending":
+            for user_id in (checkpoint["a"], checkpoint["b"]):
+                try:
+                    user = await resolve_user(user_id)
+                    await user.send("Your battle was interrupted by a bot restart and has been canceled.")
+                except Exception as e:
+                    print(f"Could not notify {user_id} that their battle was canceled: {e}")
+
+    await coordinator.store.release_owned_by(PROCESS_ID, keep=restored_ids)
+    await checkpoint_writer.flush()
+    if checkpoints:
+        print(f"Recovered {len(checkpoints)} battle checkpoints.")
+
+@bot.listen('on_message')
+async def route_direct_message(message):
+    """Hand DM replies to whichever battle prompt is waiting on their author."""
+    if message.guild is not None or message.author.bot:
+        return
+    if not message_router.is_waiting(message.author.id):
+        # The battle may be running in another process; DMs only arrive at shard 0.
+        if SHARD_COUNT and not message.content.startswith(bot.command_prefix):
+            await coordinator.forward_message(message.author.id, message.content)
+        return
+    reply = message_router.dispatch(message.author.id, message.content)
+    if reply:
+        await message.channel.send(reply)
+
+async def on_forwarded_message(payload):
+    if payload["origin"] == PROCESS_ID or not message_router.is_waiting(payload["author_id"]):
+        return
+    reply = message_router.dispatch(payload["author_id"], payload["content"])
+    if reply:
+        user = await resolve_user(payload["author_id"])
+        await user.send(reply)
+
+async def share_cache_event(event, **fields):
+    """Tell the other shard processes about a change to the catalog or leaderboard."""
+    if not SHARD_COUNT:
+        return
+    try:
+        await coordinator.publish_cache_event(event, **fields)
+    except Exception as e:
+        print(f"Error sharing {event} cache event: {e}")
+
+async def on_cache_event(payload):
+    if payload["origin"] == PROCESS_ID:
+        return
+    if payload["event"] == "leaderboard":
+        leaderboard.invalidate(notify=False)
+    elif card_catalog.server_side:
+        return
+    elif payload["event"] == "card_added":
+        card_catalog.add(payload["card"])
+    elif payload["event"] == "card_removed":
+        card_catalog.remove(payload["card_id"])
+
+async def restock_card(card):
+    await card_catalog.restock(card)
+    await share_cache_event("card_added", card=card)
+
+async def on_forwarded_accept(payload):
+    """Run a battle this process owns that was accepted through another shard."""
+    battle_data = battle_registry.get(payload["battle_id"])
+    if not battle_data or battle_data["userB_id"] != payload["user_id"]:
+        return
+    channel = bot.get_channel(battle_data["channel_id"]) or await bot.fetch_channel(battle_data["channel_id"])
+    userB = await resolve_user(payload["user_id"])
+    await run_accepted_battle(channel, battle_data, userB)
 
 @bot.command(name="roll")
 async def give_daily_cards(ctx):
     user_id = str(ctx.author.id)
     today = datetime.now().date().strftime("%Y-%m-%d")
 
-    user_profile = users_collection.find_one({"user_id": user_id})
-
+    # Reserve the roll first, so spamming !roll past the daily limit never touches the market.
+    user_profile = await database.reserve_daily_roll(user_id, ctx.author.name, today, MAX_DAILY_ROLLS)
     if not user_profile:
-        user_profile = {
-            "user_id": user_id,
-            "name": ctx.author.name,
-            "date": "", 
-            "points": 0, 
-            "wins": 0,    
-            "losses": 0, 
-            "cards": [],
-            "visit_count": 0
-        }
-        users_collection.insert_one(user_profile)
-
-    available_cards = list(available_cards_collection.find({}))
-    if not available_cards:
-        await ctx.author.send("No cards are available at the moment. Please try again later.")
+        await ctx.send(f"{ctx.author.mention}, you’ve already received your cards today. Check this link for more info: https://www.BeingSarangi.com")
         return
 
-    if user_profile.get("date") != today:
-        user_profile["visit_count"] = 0
-        user_profile["date"] = today
-        users_collection.update_one({"user_id": user_id}, {"$set": {"date": today, "visit_count": 0}})
+    daily_card = None
+    for _ in range(CARD_CLAIM_ATTEMPTS):
+        candidate = await card_catalog.draw()
+        if not candidate:
+            break
+        daily_card = await database.claim_available_card(candidate["_id"])
+        card_catalog.remove(candidate["_id"])
+        if daily_card:
+            await share_cache_event("card_removed", card_id=daily_card["_id"])
+            break
 
-    if user_profile.get("visit_count") == 0:
-        daily_card = random.choice(available_cards)
-        user_profile["cards"] = [daily_card]
-        user_profile["visit_count"] += 1
+    if not daily_card:
+        await database.release_daily_roll(user_id, today)
+        await ctx.author.send("No cards are available at the moment. Please try again later.")
+        return
 
-        available_cards_collection.delete_one({"_id": daily_card["_id"]})
+    try:
+        await database.grant_card(user_id, daily_card)
+    except Exception:
+        await restock_card(daily_card)
+        await database.release_daily_roll(user_id, today)
+        raise
+    event_log.log("roll", user_id=user_id, card_id=daily_card["_id"], card=daily_card["name"])
 
-        users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"cards": user_profile["cards"], "visit_count": user_profile["visit_count"]}}
-        )
+    if user_profile["visit_count"] == 1:
         await ctx.author.send(f"Here is your first card for today:\n{daily_card['image_url']}")
-    elif user_profile.get("visit_count") == 1:
-        daily_card = random.choice(available_cards)
-        user_profile["cards"].append(daily_card)
-        user_profile["visit_count"] += 1
-
-        available_cards_collection.delete_one({"_id": daily_card["_id"]})
-
-        users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"cards": user_profile["cards"], "visit_count": user_profile["visit_count"]}}
-        )
-        await ctx.author.send(f"Here is your second card for today:\n{daily_card['image_url']}")
     else:
-        await ctx.send(f"{ctx.author.mention}, you’ve already received your cards today. Check this link for more info: https://www.BeingSarangi.com")
-
+        await ctx.author.send(f"Here is your second card for today:\n{daily_card['image_url']}")
 
 
-def save_user_data(user_data):
-    try:
-        for user_id, user_profile in user_data["users"].items():
-            users_collection.update_one(
-                {"user_id": user_id}, 
-                {"$set": user_profile}, 
-                upsert=True  
-            )
-        print("User data saved successfully.")
-    except Exception as e:
-        print(f"Error saving user data to MongoDB: {e}")
 
 @bot.command()
 async def battle(ctx: commands.Context, opponent: str):
@@ -166,37 +361,28 @@ async def battle(ctx: commands.Context, opponent: str):
         userA_id = str(ctx.author.id)
         userB_id = str(opponent_user.id)
 
-        userA_data = users_collection.find_one({"user_id": userA_id})
-        userB_data = users_collection.find_one({"user_id": userB_id})
+        userA_data, userB_data = map(UserProfile.from_document, await asyncio.gather(
+            database.find_user(userA_id),
+            database.find_user(userB_id)
+        ))
 
         if not userA_data or not userB_data:
             await ctx.send("One or both players don't exist in the system.")
             return
 
-        userA_cards = userA_data.get("cards", [])
-        userB_cards = userB_data.get("cards", [])
-
-        if len(userA_cards) < 3 or len(userB_cards) < 3:
+        if len(userA_data.cards) < 3 or len(userB_data.cards) < 3:
             await ctx.send("One of the players doesn't have enough cards to battle! Both players need at least 3 cards.")
             return
 
-        bot_selected_A = random.sample(userA_cards, 3)
-        bot_selected_B = random.sample(userB_cards, 3)
-
-        battle_data = {
-            "userA_id": userA_id,
-            "userB_id": userB_id,
-            "userA_cards": bot_selected_A,
-            "userB_cards": bot_selected_B,
-            "status": "pending"
-        }
-        active_battles[userA_id] = battle_data
-        active_battles[userB_id] = battle_data
+        battle_data = await register_battle(userA_data, userB_data, ctx.channel.id)
+        if not battle_data:
+            await ctx.send("One of the players is already in a battle.")
+            return
 
         await ctx.send(f"{ctx.author.mention} challenged {opponent_user.mention} to a battle! Type `!accept` to join.")
 
-        await send_card_images(ctx.author, bot_selected_A)
-        await send_card_images(opponent_user, bot_selected_B)
+        await send_card_images(ctx.author, battle_data['userA_cards'])
+        await send_card_images(opponent_user, battle_data['userB_cards'])
 
     except commands.CommandError as e:
         await ctx.send(f"An error occurred: {e}")
@@ -206,192 +392,301 @@ async def battle(ctx: commands.Context, opponent: str):
         print(f"Unexpected error in battle command: {e}")
 
 
+async def register_battle(userA_data, userB_data, channel_id):
+    """Deal three random cards to each player and claim the battle; None if either player is busy."""
+    battle_data = battle_registry.create(
+        userA_data.user_id, userB_data.user_id,
+        random.sample(userA_data.cards, 3), random.sample(userB_data.cards, 3)
+    )
+    if not battle_data:
+        return None
+    battle_data['channel_id'] = channel_id
+    if not await coordinator.claim(battle_data, channel_id):
+        battle_registry.cancel(battle_data['battle_id'])
+        return None
+    checkpoint_writer.save(battle_data, "accept")
+    matchmaking_queue.leave(userA_data.user_id)
+    matchmaking_queue.leave(userB_data.user_id)
+    return battle_data
+
+
+@bot.command(name="queue")
+async def queue(ctx, action: str = "join"):
+    """Join the matchmaking queue, or `!queue leave` / `!queue stats`."""
+    user_id = str(ctx.author.id)
+    action = action.lower()
+
+    if action == "leave":
+        if matchmaking_queue.leave(user_id):
+            await ctx.send(f"{ctx.author.mention}, you left the matchmaking queue.")
+        else:
+            await ctx.send(f"{ctx.author.mention}, you are not in the matchmaking queue.")
+        return
+
+    if action == "stats":
+        stats = matchmaking_queue.stats()
+        await ctx.send(
+            f"Players waiting: {stats['waiting']} | Matches made: {stats['matched']} | "
+            f"Wait p50 {stats['p50']:.0f}s, p90 {stats['p90']:.0f}s, p99 {stats['p99']:.0f}s"
+        )
+        return
+
+    if user_id in matchmaking_queue:
+        await ctx.send(f"{ctx.author.mention}, you are already in the matchmaking queue.")
+        return
+    if battle_registry.for_user(user_id):
+        await ctx.send(f"{ctx.author.mention}, you are already in a battle.")
+        return
+
+    user_data = UserProfile.from_document(await database.find_user(
+        user_id, projection={"user_id": 1, "points": 1, "Wins": 1, "Losses": 1, "cards._id": 1}
+    ))
+    if not user_data or len(user_data.cards) < 3:
+        await ctx.send(f"{ctx.author.mention}, you need at least 3 cards to battle.")
+        return
+    # A second !queue may have joined while the profile was loading.
+    if user_id in matchmaking_queue:
+        await ctx.send(f"{ctx.author.mention}, you are already in the matchmaking queue.")
+        return
+
+    pair = matchmaking_queue.join(user_id, matchmaking_queue.rating(user_data), ctx.channel.id)
+    if pair is None:
+        await ctx.send(f"{ctx.author.mention} joined the matchmaking queue. Type `!queue leave` to stop waiting.")
+        return
+    await start_matches([pair])
+
+async def start_matches(pairs):
+    """Fetch every matched player's profile in one query, then start their battles."""
+    user_ids = [entry.user_id for pair in pairs for entry in pair]
+    profiles = {profile.user_id: profile for profile in map(UserProfile, await database.find_users(user_ids))}
+    results = await asyncio.gather(
+        *(start_match(first, second, profiles) for first, second in pairs),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Error starting matched battle: {result}")
+
+async def start_match(entryA, entryB, profiles):
+    """Start a matched battle straight away; both players already opted in, so there is no !accept."""
+    channel = bot.get_channel(entryA.channel_id) or await bot.fetch_channel(entryA.channel_id)
+    userA_data = profiles.get(entryA.user_id)
+    userB_data = profiles.get(entryB.user_id)
+
+    battle_data = None
+    if userA_data and userB_data and len(userA_data.cards) >= 3 and len(userB_data.cards) >= 3:
+        battle_data = await register_battle(userA_data, userB_data, entryA.channel_id)
+    userA, userB = await asyncio.gather(resolve_user(entryA.user_id), resolve_user(entryB.user_id))
+    if not battle_data:
+        await channel.send(f"{userA.mention} and {userB.mention} were matched, but one of them can no longer battle. Type `!queue` to try again.")
+        return
+
+    if entryB.channel_id != entryA.channel_id:
+        other_channel = bot.get_channel(entryB.channel_id) or await bot.fetch_channel(entryB.channel_id)
+        await other_channel.send(f"{userB.mention}, you were matched with {userA.mention}! The battle is in {channel.mention}.")
+    await channel.send(f"Matched {userA.mention} with {userB.mention}!")
+    await run_accepted_battle(channel, battle_data, userB)
+
+async def notify_queue_expired(entries):
+    for entry in entries:
+        try:
+            user = await resolve_user(entry.user_id)
+            await user.send("No opponent was found in time, so you have been removed from the matchmaking queue.")
+        except Exception as e:
+            print(f"Could not notify {entry.user_id} that their queue entry expired: {e}")
+
+
 @bot.command()
 async def accept(ctx):
     """Accept a pending battle and allow both players to select additional cards."""
-    user_id = ctx.author.id
-    battle_data = next((battle for battle in active_battles.values() 
-                        if battle.get('userB_id') == user_id and battle.get('status') == 'pending'), None)
+    user_id = str(ctx.author.id)
+    battle_data = battle_registry.pending_for_opponent(user_id)
 
     if not battle_data:
+        challenge = await coordinator.store.pending_for_opponent(user_id)
+        if challenge and challenge['owner'] != PROCESS_ID:
+            await coordinator.forward_accept(challenge, user_id, ctx.channel.id)
+            await ctx.send("Battle accepted! Watch your DMs to pick your cards.")
+            return
         await ctx.send("No pending battle found for you to accept.")
         return
 
-    userA = bot.get_user(battle_data['userA_id'])
-    userB = ctx.author
+    await run_accepted_battle(ctx, battle_data, ctx.author)
+
+async def run_accepted_battle(ctx, battle_data, userB):
+    """Start an accepted battle; `ctx` is anything with send(), such as the challenge channel."""
+    async with battle_registry.lock(battle_data['battle_id']):
+        # A forwarded accept can arrive after the challenge expired or was cancelled.
+        if battle_registry.get(battle_data['battle_id']) is not battle_data:
+            await ctx.send("This challenge is no longer open.")
+            return
+        if battle_data['status'] != 'pending':
+            await ctx.send("This battle has already started.")
+            return
+        battle_data['status'] = 'active'
+        checkpoint_writer.save(battle_data, "select")
+
+    userA = await resolve_user(battle_data['userA_id'])
     await ctx.send(f"{userA.mention} and {userB.mention} are ready for battle! Let’s begin!")
     
-    await send_card_images(userA, battle_data['userA_cards'])
-    await send_card_images(userB, battle_data['userB_cards'])
+    await asyncio.gather(
+        send_card_images(userA, battle_data['userA_cards']),
+        send_card_images(userB, battle_data['userB_cards'])
+    )
 
     await ctx.send("Both players, select two additional cards to complete your hand.")
 
     try:
         await get_additional_cards(ctx, battle_data, userA, userB)
-        del active_battles[battle_data['userA_id']]
-        del active_battles[battle_data['userB_id']]
+        finish_battle(battle_data, completed=True)
     except asyncio.TimeoutError:
-        await ctx.send("A player took too long to select their cards. The battle has been canceled.")
-        del active_battles[battle_data['userA_id']]
-        del active_battles[battle_data['userB_id']]
+        await ctx.send("A player took too long to pick a card. The battle has been canceled.")
+        finish_battle(battle_data, completed=False)
+    except Exception:
+        finish_battle(battle_data, completed=False)
+        raise
 
 
 
-async def get_additional_cards(ctx, battle):
+async def gather_with_deadline(*coros, timeout):
+    """Run prompts concurrently under one shared deadline, cancelling the rest if any fails."""
+    tasks = [asyncio.ensure_future(coro) for coro in coros]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+        for task in done:
+            if task.exception() is not None:
+                raise task.exception()
+        if pending:
+            raise asyncio.TimeoutError
+        return [task.result() for task in tasks]
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def get_additional_cards(ctx, battle, userA, userB):
     """Prompt both players to select two additional cards."""
-    userA_id = battle['userA_id']
-    userB_id = battle['userB_id']
-
     userA_initial_cards = battle['userA_cards']
     userB_initial_cards = battle['userB_cards']
 
-    userA = bot.get_user(userA_id)
-    userB = bot.get_user(userB_id)
-
     try:
-        userA_hand = await prompt_user_for_cards(userA, userA_initial_cards)
-        userB_hand = await prompt_user_for_cards(userB, userB_initial_cards)
+        userA_hand, userB_hand = await gather_with_deadline(
+            prompt_user_for_cards(userA, userA_initial_cards),
+            prompt_user_for_cards(userB, userB_initial_cards),
+            timeout=SELECTION_TIMEOUT
+        )
+    except asyncio.TimeoutError:
+        await asyncio.gather(
+            userA.send("Card selection timed out."),
+            userB.send("Card selection timed out."),
+            return_exceptions=True
+        )
+        raise
 
-        full_userA_hand = userA_initial_cards + userA_hand
-        full_userB_hand = userB_initial_cards + userB_hand
+    full_userA_hand = userA_initial_cards + userA_hand
+    full_userB_hand = userB_initial_cards + userB_hand
 
-        await ctx.send("Both players have selected their cards. Let the battle begin!")
-        await start_battle(ctx, battle, full_userA_hand, full_userB_hand)
-
-    except asyncio.TimeoutError:
-        await ctx.send("A player took too long to select their cards. The battle has been canceled.")
+    await start_battle(ctx, battle, full_userA_hand, full_userB_hand)
 
 async def prompt_user_for_cards(user, available_cards):
     """Prompt a user to select two additional cards."""
-    def check(m):
-        return m.author.id == user.id and m.channel.type == discord.ChannelType.private
-
+    cards_by_name = hand_index(available_cards)
     selected_cards = []
-    available_card_names = [card['name'] for card in available_cards]
 
-    try:
-        await user.send(f"Select two additional cards from the following: {', '.join(available_card_names)}")
+    def parse(content):
+        card = cards_by_name.get(content.lower())
+        if card is None or card in selected_cards:
+            raise InvalidInput("Invalid or duplicate card selected. Please try again.")
+        return card
 
-        for _ in range(2):
-            await user.send("Type the name of the card you want to select:")
-            msg = await bot.wait_for('message', check=check, timeout=60.0)
-            card_name = msg.content.strip()
+    await user.send(f"Select two additional cards from the following: {', '.join(card.name for card in available_cards)}")
 
-            if card_name in available_card_names and card_name not in selected_cards:
-                selected_cards.append(card_name)
-                await send_card(user, card_name)
-            else:
-                await user.send("Invalid or duplicate card selected. Please try again.")
-                continue
+    while len(selected_cards) < 2:
+        await user.send("Type the name of the card you want to select:")
+        card = await message_router.wait_for(user.id, parse)
+        selected_cards.append(card)
+        await send_card(user, card.name)
 
-        return [get_card_by_name(name, available_cards) for name in selected_cards]
+    return selected_cards
 
-    except asyncio.TimeoutError:
-        await user.send("You took too long to select your cards.")
-        raise
-
-def get_card_by_name(card_name, cards):
-    """Retrieve a card object by its name."""
-    return next((card for card in cards if card['name'].lower() == card_name.lower()), None)
-
-async def start_battle(ctx, battle, userA_initial_cards, userB_initial_cards, card_name1, card_name2, card_name1_b, card_name2_b):
+async def start_battle(ctx, battle, userA_hand, userB_hand):
     """Begin the battle after players select their cards."""
     await ctx.send("Both players have selected their cards. Let the battle begin!")
 
-    def map_card_names_to_objects(card_names, available_cards):
-        selected_cards = []
-        for name in card_names:
-            card = next((c for c in available_cards if c['name'].lower() == name.lower()), None)
-            if card:
-                selected_cards.append(card)
-        return selected_cards
-
-    userA_hand = userA_initial_cards + map_card_names_to_objects([card_name1, card_name2], userA_initial_cards)
-    userB_hand = userB_initial_cards + map_card_names_to_objects([card_name1_b, card_name2_b], userB_initial_cards)
-
-    if len(userA_hand) != len(userA_initial_cards) + 2 or len(userB_hand) != len(userB_initial_cards) + 2:
-        await ctx.send("Error mapping card names to card objects. Please try again.")
-        return
-
-    print(f"User A Hand: {userA_hand}")
-    print(f"User B Hand: {userB_hand}")
+    event_log.log(
+        "battle_start", battle_id=battle['battle_id'], a=battle['userA_id'], b=battle['userB_id'],
+        hand_a=[card.id for card in userA_hand], hand_b=[card.id for card in userB_hand]
+    )
 
     await start_battle_rounds(ctx, userA_hand, userB_hand, battle)
 
 
 async def start_battle_rounds(ctx, userA_hand, userB_hand, battle):
     """Conducts the battle rounds between two users."""
-    userA = bot.get_user(battle['userA_id'])
-    userB = bot.get_user(battle['userB_id'])
+    userA, userB = await asyncio.gather(
+        resolve_user(battle['userA_id']),
+        resolve_user(battle['userB_id'])
+    )
     
-    valid_stats = ['rating', 'apps', 'agr', 'sv', 'g/a', 'tw']
+    userA_score = 0
+    userB_score = 0
 
-    for round_num in range(1, 6):
+    for round_num in range(1, ROUNDS + 1):
+        checkpoint_writer.save(battle, "round", round_num, userA_hand, userB_hand, userA_score, userB_score)
         await ctx.send(f"Round {round_num} begins!")
 
-        cards_message_a = "\n".join([f"{card['name']} - {card['rating']} rating, {card['APPS']} apps, {card['agr']} agr, {card.get('SV', 'N/A')} SV, {card.get('G/A', 'N/A')} G/A, {card.get('TW', 'N/A')} TW" for card in userA_hand if card is not None])
-        cards_message_b = "\n".join([f"{card['name']} - {card['rating']} rating, {card['APPS']} apps, {card['agr']} agr, {card.get('SV', 'N/A')} SV, {card.get('G/A', 'N/A')} G/A, {card.get('TW', 'N/A')} TW" for card in userB_hand if card is not None])
-
-        await userA.send(f"Choose a card and a stat (Rating, APPS, AGR, SV, G/A, TW):\n{cards_message_a}")
-        await userB.send(f"Choose a card (same stat will be used for comparison for User B):\n{cards_message_b}")
-
-        def check_a(m):
-            if m.author.id == userA.id:
-                parts = m.content.split()
-                if len(parts) >= 2:  
-                    stat_name = parts[-1].lower()
-                    card_name = ' '.join(parts[:-1]).lower() 
-                    if any(card['name'].lower() == card_name for card in userA_hand) and stat_name in valid_stats:
-                        return True
-                    else:
-                        m.channel.send("Invalid input! Please enter the card name followed by the stat (e.g., 'Alexander Isak rating').")
-            return False
-
-        def check_b(m):
-            if m.author.id == userB.id:
-                card_name = m.content.strip().lower()
-                if any(card['name'].lower() == card_name for card in userB_hand):
-                    return True
-                else:
-                    m.channel.send("Invalid input! Please enter the card name (e.g., 'Bruno Guimaraes').")
-            return False
+        cards_message_a = "\n".join(card.display_line for card in userA_hand)
+        cards_message_b = "\n".join(card.display_line for card in userB_hand)
+
+        await asyncio.gather(
+            userA.send(f"Choose a card and a stat (Rating, APPS, AGR, SV, G/A, TW):\n{cards_message_a}"),
+            userB.send(f"Choose a card (same stat will be used for comparison for User B):\n{cards_message_b}")
+        )
+
+        userA_cards = hand_index(userA_hand)
+        userB_cards = hand_index(userB_hand)
+
+        def parse_a(content):
+            parts = content.split()
+            if len(parts) >= 2:
+                card = userA_cards.get(' '.join(parts[:-1]).lower())
+                if card is not None and parts[-1].lower() in STAT_FIELDS:
+                    return card, parts[-1]
+            raise InvalidInput("Invalid input! Please enter the card name followed by the stat (e.g., 'Alexander Isak rating').")
+
+        def parse_b(content):
+            card = userB_cards.get(content.lower())
+            if card is None:
+                raise InvalidInput("Invalid input! Please enter the card name (e.g., 'Bruno Guimaraes').")
+            return card
 
         try:
-            message_a = await bot.wait_for('message', check=check_a, timeout=200.0)
-            message_a_content = message_a.content.strip().split()
-            if len(message_a_content) == 2:
-                card_a, stat_a = message_a_content
-            elif len(message_a_content) == 3:
-                card_a = f"{message_a_content[0]} {message_a_content[1]}" 
-                stat_a = message_a_content[2]
-            else:
-                await ctx.send("Invalid input. Please enter either two or three words.")
-                return
-
-            selected_card_a = next(card for card in userA_hand if card['name'].lower() == card_a.lower())
-            await send_card_images(userB, [selected_card_a])
-
-            message_b = await bot.wait_for('message', check=check_b, timeout=200.0)
-            card_b = message_b.content.strip().lower()
-            selected_card_b = next(card for card in userB_hand if card['name'].lower() == card_b)
-
-            await send_card_images(userA, [selected_card_b])
-            stat_value_a = selected_card_a.get(stat_a, "N/A")
-            stat_value_b = selected_card_b.get(stat_a, "N/A")
-            
-            if stat_value_a == "N/A":
-                stat_value_a = 0
-            if stat_value_b == "N/A":
-                stat_value_b = 0
-
-            userA_score = 0
-            userB_score = 0
-            if stat_value_a > stat_value_b:
+            (selected_card_a, stat_a), selected_card_b = await gather_with_deadline(
+                message_router.wait_for(userA.id, parse_a),
+                message_router.wait_for(userB.id, parse_b),
+                timeout=ROUND_TIMEOUT
+            )
+
+            await asyncio.gather(
+                send_card_images(userB, [selected_card_a]),
+                send_card_images(userA, [selected_card_b])
+            )
+            stat_value_a = selected_card_a.stat(stat_a)
+            stat_value_b = selected_card_b.stat(stat_a)
+
+            a_wins = challenger_wins_round(stat_value_a, stat_value_b)
+            if a_wins:
                 round_winner = "User A"
                 userA_score += 1
             else:
                 round_winner = "User B"
                 userB_score += 1
+            event_log.log(
+                "round", battle_id=battle['battle_id'], round=round_num,
+                card_a=selected_card_a.id, card_b=selected_card_b.id, stat=stat_a.lower(),
+                value_a=stat_value_a, value_b=stat_value_b,
+                winner=battle['userA_id'] if a_wins else battle['userB_id']
+            )
 
             userA_hand.remove(selected_card_a)
             userB_hand.remove(selected_card_b)
@@ -399,35 +694,44 @@ async def start_battle_rounds(ctx, userA_hand, userB_hand, battle):
             await ctx.send(f"Round {round_num} winner: {round_winner}")
 
         except asyncio.TimeoutError:
-            await ctx.send("A user took too long to select a card.")
-            return
+            # run_accepted_battle reports it and records the battle as cancelled.
+            await asyncio.gather(
+                userA.send("Card selection timed out."),
+                userB.send("Card selection timed out."),
+                return_exceptions=True
+            )
+            raise
 
     await determine_final_winner(ctx, userA_score, userB_score, userA, userB, battle)
 
 
-async def determine_final_winner(ctx, userA_score, userB_score, userA, userB, data):
+async def determine_final_winner(ctx, userA_score, userB_score, userA, userB, battle):
     if userA_score > userB_score:
         final_winner = f"<@{userA.id}> with {userA_score} points!"
-        if userA.id in data["users"]:
-            data["users"][userA.id]["points"] += 5
+        winner_id, loser_id = battle['userA_id'], battle['userB_id']
     elif userB_score > userA_score:
         final_winner = f"<@{userB.id}> with {userB_score} points!"
-        if userB.id in data["users"]:
-            data["users"][userB.id]["points"] += 5
+        winner_id, loser_id = battle['userB_id'], battle['userA_id']
     else:
         final_winner = "It's a draw! Both players have the same score."
+        winner_id = loser_id = None
+
+    if winner_id:
+        result_writer.record_battle(winner_id, loser_id)
+        event_log.log("result", battle_id=battle['battle_id'], winner=winner_id, loser=loser_id, points=WIN_POINTS)
+    else:
+        event_log.log("result", battle_id=battle['battle_id'], draw=[battle['userA_id'], battle['userB_id']])
     await ctx.send(f"The final winner is: {final_winner}")
-    
-    save_user_data(data)
 
 
 
 @bot.command(name="team")
-async def show_team_data(ctx):
+@coalesced
+async def show_team_data(ctx, page: int = 1):
     user_id = str(ctx.author.id)
 
     try:
-        user_data = users_collection.find_one({"user_id": user_id})
+        user_data = await database.find_user(user_id)
 
         if not user_data:
             await ctx.author.send("You have no data yet. Please get your cards first.")
@@ -435,34 +739,32 @@ async def show_team_data(ctx):
 
         points = user_data.get('points', 0)
         cards = user_data.get('cards', [])
+        page_count = max(1, math.ceil(len(cards) / TEAM_PAGE_SIZE))
+        page = min(max(page, 1), page_count)
 
         embed = discord.Embed(
             title=f"{ctx.author.name}'s Data",
             description=f"Points: {points}",
             color=discord.Color.green()
         )
-        await ctx.author.send(embed=embed)
-
-        if cards:
-            for card in cards:
-                card_name = card.get('name', 'Unknown Card')
-                card_rating = card.get('rating', 'N/A')
-                card_price = card.get('price', 'N/A')
-                card_image_url = card.get('image_url', '')
-
-                card_embed = discord.Embed(
-                    title=f"{card_name}",
-                    description=f"Rating: {card_rating}\nPrice: {card_price}",
-                    color=discord.Color.blue()
-                )
-
-                if card_image_url:
-                    card_embed.set_image(url=card_image_url)
+        if page_count > 1:
+            embed.set_footer(text=f"Cards page {page}/{page_count} - use !team <page>")
+
+        if not cards:
+            await delivery.send_many(ctx.author, [
+                (None, [embed]),
+                ("You don't have any cards yet. Earn or buy cards to build your team.", None)
+            ])
+            return
 
-                await ctx.author.send(embed=card_embed)
+        page_cards = cards[(page - 1) * TEAM_PAGE_SIZE:page * TEAM_PAGE_SIZE]
+        if TEAM_GRID:
+            grid = await team_grid.render(page_cards)
+            embed.set_image(url=f"attachment://{grid.filename}")
+            await delivery.send_file(ctx.author, grid, embeds=[embed])
+            return
 
-        else:
-            await ctx.author.send("You don't have any cards yet. Earn or buy cards to build your team.")
+        await delivery.send_embeds(ctx.author, [embed] + [team_card_embed(card) for card in page_cards])
 
     except Exception as e:
         await ctx.author.send(f"An error occurred while fetching your data: {e}")
@@ -472,7 +774,7 @@ async def show_team_data(ctx):
 async def sell_card(ctx, *, card_name: str):
     user_id = str(ctx.author.id)
 
-    user_data = users_collection.find_one({"user_id": user_id})
+    user_data = await database.find_user(user_id, {"cards": 1})
     if not user_data:
         await ctx.send(f"{ctx.author.mention}, you do not have an account in the system.")
         return
@@ -483,68 +785,41 @@ async def sell_card(ctx, *, card_name: str):
         await ctx.send(f"{ctx.author.mention}, you don't own a card named '{card_name}'.")
         return
     card_points = card_to_sell.get("price", 0)
-    user_points = user_data.get("points", 0)
-    new_points = user_points + card_points
-    users_collection.update_one(
-        {"user_id": user_id},
-        {"$set": {"points": new_points},
-         "$pull": {"cards": {"name": card_name}}}  
-    )
 
-    available_cards_collection.insert_one(card_to_sell)
+    updated = await database.sell_user_card(user_id, card_to_sell["_id"], card_points)
+    if not updated:
+        await ctx.send(f"{ctx.author.mention}, the card '{card_to_sell['name']}' has already been sold.")
+        return
+
+    event_log.log("sell", user_id=user_id, card_id=card_to_sell["_id"], card=card_to_sell["name"], points=card_points)
+    await restock_card(card_to_sell)
 
     await ctx.send(
-        f"{ctx.author.mention}, you have successfully sold the card '{card_name}' for {card_points} points!\n"
-        f"Your new points total is {new_points}."
+        f"{ctx.author.mention}, you have successfully sold the card '{card_to_sell['name']}' for {card_points} points!\n"
+        f"Your new points total is {updated.get('points', 0)}."
     )
 
-@bot.command(name="battlestats") 
-async def battlestats(ctx):
-    users_data = users_collection.find({})  
-
-    leaderboard = []
-    for user in users_data:
-        wins = user.get("Wins", 0)
-        losses = user.get("Losses", 0)
-        matches_played = wins + losses
-        leaderboard.append({
-            "name": user.get("name", "Unknown")[:15],
-            "wins": wins,
-            "losses": losses,
-            "matches_played": matches_played
-        })
-
-    leaderboard.sort(key=lambda x: x["wins"], reverse=True)
-
-    table = PrettyTable()
-    table.field_names = ["Rank", "User", "W", "L", "MP"] 
-
-
-    table.align["Rank"] = "l"  
-    table.align["User"] = "l"  
-    table.align["W"] = "r"     
-    table.align["L"] = "r"     
-    table.align["MP"] = "r"    
-
-   
-    for rank, user in enumerate(leaderboard, start=1):
-        if rank == 1:
-            trophy = "🏆"  
-        elif rank == 2:
-            trophy = "🥈"  
-        elif rank == 3:
-            trophy = "🥉"  
-        else:
-            trophy = "" 
-
-        table.add_row([f"{trophy} {rank}", user["name"], user["wins"], user["losses"], user["matches_played"]])
+@bot.command(name="battlestats")
+@coalesced
+async def battlestats(ctx, page: int = 1):
+    page_count = await leaderboard.page_count()
+    page = min(max(page, 1), page_count)
 
+    table, my_rank = await asyncio.gather(
+        leaderboard.page(page),
+        leaderboard.rank_of(str(ctx.author.id))
+    )
 
     embed = discord.Embed(
-        title="Battle Stats Leaderboard",  
-        description=f"```{table}```", 
-        color=discord.Color.green()  
+        title="Battle Stats Leaderboard",
+        description=f"```{table}```",
+        color=discord.Color.green()
     )
+    footer = f"Page {page}/{page_count} - use !battlestats <page>"
+    if my_rank:
+        rank, wins = my_rank
+        footer += f" | Your rank: #{rank} ({wins} W)"
+    embed.set_footer(text=footer)
 
     await ctx.send(embed=embed)
 
@@ -553,22 +828,8 @@ async def shop(ctx):
     website_url = "https://www.google.com"
     await ctx.send(f"Visit the shop: {website_url}")
 
-# bot.run(DISCORD_BOT_TOKEN)
-@app.route('/')
-def home():
-    return "Discord Bot is Running!"
-
-
-def run_flask():
-    app.run(host="0.0.0.0", port=int(os.getenv('PORT', 5000)))
-
 def run_bot():
     bot.run(os.getenv('DISCORD_BOT_TOKEN'))
 
 if __name__ == "__main__":
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.start()
-
     run_bot()
-
-
@@ -0,0 +1,118 @@
+import asyncio
+import time
+import uuid
+
+
+CHALLENGE_TTL = 300.0
+EXPIRY_INTERVAL = 30.0
+
+
+class BattleRegistry:
+    """Active battles indexed by battle id and by each participant's user id."""
+
+    def __init__(self, ttl=CHALLENGE_TTL):
+        self.ttl = ttl
+        self._battles = {}
+        self._by_user = {}
+        self._locks = {}
+        self._expiry_task = None
+        self.expired_count = 0
+        self.completed_count = 0
+
+    def __len__(self):
+        return len(self._battles)
+
+    def create(self, userA_id, userB_id, userA_cards, userB_cards, battle_id=None, age=0.0):
+        """Register a pending challenge; returns None if either player is already busy."""
+        if userA_id in self._by_user or userB_id in self._by_user:
+            return None
+
+        battle = {
+            "battle_id": battle_id or uuid.uuid4().hex,
+            "userA_id": userA_id,
+            "userB_id": userB_id,
+            "userA_cards": userA_cards,
+            "userB_cards": userB_cards,
+            "status": "pending",
+            "created_at": time.monotonic() - age
+        }
+        self._battles[battle["battle_id"]] = battle
+        self._by_user[userA_id] = battle["battle_id"]
+        self._by_user[userB_id] = battle["battle_id"]
+        self._locks[battle["battle_id"]] = asyncio.Lock()
+        return battle
+
+    def get(self, battle_id):
+        return self._battles.get(battle_id)
+
+    def for_user(self, user_id):
+        battle_id = self._by_user.get(user_id)
+        return None if battle_id is None else self._battles[battle_id]
+
+    def pending_for_opponent(self, user_id):
+        """The challenge waiting for `user_id` to accept, if any."""
+        battle = self.for_user(user_id)
+        if battle and battle["userB_id"] == user_id and battle["status"] == "pending":
+            return battle
+        return None
+
+    def lock(self, battle_id):
+        """The battle's lock, or a fresh one if the battle has already been removed."""
+        return self._locks.get(battle_id) or asyncio.Lock()
+
+    def _remove(self, battle_id):
+        battle = self._battles.pop(battle_id, None)
+        if battle is None:
+            return None
+        self._locks.pop(battle_id, None)
+        for user_id in (battle["userA_id"], battle["userB_id"]):
+            if self._by_user.get(user_id) == battle_id:
+                del self._by_user[user_id]
+        return battle
+
+    def complete(self, battle_id):
+        if self._remove(battle_id) is not None:
+            self.completed_count += 1
+
+    def cancel(self, battle_id):
+        self._remove(battle_id)
+
+    def expire(self, now=None):
+        """Drop pending challenges older than the TTL and return them."""
+        now = time.monotonic() if now is None else now
+        stale = [
+            battle_id for battle_id, battle in self._battles.items()
+            if battle["status"] == "pending" and now - battle["created_at"] > self.ttl
+        ]
+        expired = [self._remove(battle_id) for battle_id in stale]
+        self.expired_count += len(expired)
+        return expired
+
+    async def _expire_forever(self, interval, on_expired):
+        while True:
+            await asyncio.sleep(interval)
+            expired = self.expire()
+            if expired:
+                print(f"Expired {len(expired)} abandoned battle challenges.")
+                if on_expired:
+                    on_expired(expired)
+
+    def start(self, interval=EXPIRY_INTERVAL, on_expired=None):
+        """Start the background expiry task (no-op if it is already running)."""
+        if self._expiry_task is None or self._expiry_task.done():
+            self._expiry_task = asyncio.create_task(self._expire_forever(interval, on_expired))
+
+    def stop(self):
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+
+    def stats(self):
+        return {
+            "active": len(self._battles),
+            "expired": self.expired_count,
+            "completed": self.completed_count
+        }
+
+
+battle_registry = BattleRegistry()
@@ -0,0 +1,74 @@
+"""Offline throughput of the embed delivery layer against a fake Discord HTTP transport.
+
+Run from the repository root: python benchmarks/bench_delivery.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delivery import Delivery
+
+
+class FakeRateLimited(Exception):
+    status = 429
+
+    def __init__(self, retry_after):
+        super().__init__("429 Too Many Requests")
+        self.retry_after = retry_after
+
+
+class FakeTransport:
+    """Simulates per-request latency and a per-destination bucket of `burst` requests per `window` seconds."""
+
+    def __init__(self, latency=0.02, burst=5, window=1.0):
+        self.latency = latency
+        self.burst = burst
+        self.window = window
+        self.requests = 0
+        self.rejected = 0
+        self._buckets = {}
+
+    async def __call__(self, destination, content=None, embeds=None):
+        now = time.monotonic()
+        window_start, used = self._buckets.get(destination, (now, 0))
+        if now - window_start >= self.window:
+            window_start, used = now, 0
+        if used >= self.burst:
+            self.rejected += 1
+            raise FakeRateLimited(self.window - (now - window_start))
+        self._buckets[destination] = (window_start, used + 1)
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+
+
+async def one_embed_per_message(transport, destination, embeds):
+    for embed in embeds:
+        delivery = Delivery(transport)
+        await delivery.send(destination, embeds=[embed])
+
+
+async def packed(transport, destination, embeds):
+    await Delivery(transport).send_embeds(destination, embeds)
+
+
+async def run(strategy, users, cards):
+    transport = FakeTransport()
+    embeds = [f"card-{i}" for i in range(cards)]
+    start = time.perf_counter()
+    await asyncio.gather(*(strategy(transport, user, embeds) for user in range(users)))
+    return time.perf_counter() - start, transport
+
+
+async def main():
+    users, cards = 50, 40
+    print(f"{users} users x {cards} cards")
+    for name, strategy in (("one embed per message", one_embed_per_message), ("packed", packed)):
+        elapsed, transport = await run(strategy, users, cards)
+        print(f"{name:>22}: {elapsed:6.2f}s  {transport.requests} requests  {transport.rejected} rate-limited")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
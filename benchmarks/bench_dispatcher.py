@@ -0,0 +1,53 @@
+"""Per-message routing cost of MessageRouter as the number of waiting battles grows.
+
+Run from the repository root: python benchmarks/bench_dispatcher.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dispatcher import InvalidInput, MessageRouter, hand_index
+from models import Card
+
+
+HAND = hand_index(Card.from_documents({"name": f"Player {i}"} for i in range(5)))
+MESSAGES = 20000
+
+
+def parse(content):
+    card = HAND.get(content.lower())
+    if card is None:
+        raise InvalidInput("Invalid input!")
+    return card
+
+
+async def measure(battles):
+    router = MessageRouter()
+    # Two players per battle are waiting on a DM.
+    waiters = [asyncio.create_task(router.wait_for(user_id, parse)) for user_id in range(battles * 2)]
+    await asyncio.sleep(0)
+
+    # Invalid replies keep every waiter registered, so each message pays the full lookup.
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        router.dispatch(i % (battles * 2), "not a card")
+    elapsed = time.perf_counter() - start
+
+    for task in waiters:
+        task.cancel()
+    await asyncio.gather(*waiters, return_exceptions=True)
+    return elapsed / MESSAGES
+
+
+async def main():
+    print(f"{'battles':>8} {'ns/message':>12}")
+    for battles in (10, 100, 1000, 10000):
+        per_message = await measure(battles)
+        print(f"{battles:>8} {per_message * 1e9:>12.0f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,79 @@
+"""Per-command cost of the metrics instrumentation.
+
+Times the before/after-invoke hooks (which feed metrics.observe_command) and
+the MongoCommandTimer listener that runs on every Mongo round-trip, against
+an uninstrumented baseline that awaits two empty hooks. The loadtest calls
+handlers directly, so this is where the instrumentation overhead is measured.
+
+Run from the repository root: python benchmarks/bench_metrics.py
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battle
+from metrics import Metrics, MongoCommandTimer
+
+
+CALLS = 200000
+COMMANDS = ("roll", "team", "battle", "accept", "queue", "battlestats", "sell")
+
+
+class FakeCommand:
+    def __init__(self, name):
+        self.qualified_name = name
+
+
+class FakeContext:
+    def __init__(self, command):
+        self.command = FakeCommand(command)
+        self.command_failed = False
+
+
+class FakeCommandEvent:
+    """The two fields MongoCommandTimer reads from pymongo's CommandSucceededEvent."""
+
+    def __init__(self, command_name):
+        self.command_name = command_name
+        self.duration_micros = 850
+
+
+async def no_hook(ctx):
+    pass
+
+
+async def time_hooks(before, after):
+    contexts = [FakeContext(COMMANDS[i % len(COMMANDS)]) for i in range(len(COMMANDS))]
+    start = time.perf_counter()
+    for i in range(CALLS):
+        ctx = contexts[i % len(contexts)]
+        await before(ctx)
+        await after(ctx)
+    return (time.perf_counter() - start) / CALLS
+
+
+def time_listener():
+    listener = MongoCommandTimer(Metrics())
+    events = [FakeCommandEvent(name) for name in ("find", "update", "insert", "findAndModify")]
+    start = time.perf_counter()
+    for i in range(CALLS):
+        listener.succeeded(events[i % len(events)])
+    return (time.perf_counter() - start) / CALLS
+
+
+async def main():
+    baseline = await time_hooks(no_hook, no_hook)
+    instrumented = await time_hooks(battle.start_command_timer, battle.record_command_latency)
+    listener = time_listener()
+    print(f"{'empty hooks':>24}: {baseline * 1e9:8.0f} ns/command")
+    print(f"{'invoke hooks + observe':>24}: {instrumented * 1e9:8.0f} ns/command "
+          f"(+{(instrumented - baseline) * 1e9:.0f} ns)")
+    print(f"{'MongoCommandTimer':>24}: {listener * 1e9:8.0f} ns/round-trip")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""Battle-result write throughput: one update per player vs the buffered bulk writer.
+
+Uses the in-memory mongomock stand-in (requires mongomock-motor).
+Run from the repository root: python benchmarks/bench_results.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from results import WIN_POINTS, ResultWriter
+
+
+USERS = 2000
+BATTLES = 20000
+
+
+async def reset():
+    database.connect()
+    await database.users_collection.delete_many({})
+    await database.users_collection.insert_many([
+        {"user_id": str(i), "name": f"user{i}", "points": 0, "Wins": 0, "Losses": 0, "cards": []}
+        for i in range(USERS)
+    ])
+
+
+def battles():
+    rng = random.Random(42)
+    return [tuple(map(str, rng.sample(range(USERS), 2))) for _ in range(BATTLES)]
+
+
+async def check(results):
+    """Compare every seeded user's totals with the ones the battles should have produced."""
+    wins = Counter(winner_id for winner_id, _ in results)
+    losses = Counter(loser_id for _, loser_id in results)
+    failures = []
+    async for user in database.users_collection.find({}):
+        user_id = user["user_id"]
+        expected = {"points": wins[user_id] * WIN_POINTS, "Wins": wins[user_id], "Losses": losses[user_id]}
+        stored = {field: user.get(field) for field in expected}
+        if stored != expected:
+            failures.append(f"user {user_id}: {stored}, expected {expected}")
+    return failures
+
+
+async def per_player_updates(results):
+    for winner_id, loser_id in results:
+        await database.update_user(winner_id, {"$inc": {"points": WIN_POINTS, "Wins": 1}})
+        await database.update_user(loser_id, {"$inc": {"Losses": 1}})
+    return BATTLES * 2
+
+
+async def buffered_writer(results):
+    writer = ResultWriter()
+    round_trips = 0
+    original = database.write_user_results
+
+    async def counting_write(operations):
+        nonlocal round_trips
+        round_trips += 1
+        await original(operations)
+
+    database.write_user_results = counting_write
+    try:
+        for winner_id, loser_id in results:
+            writer.record_battle(winner_id, loser_id)
+        await writer.stop()
+    finally:
+        database.write_user_results = original
+    return round_trips
+
+
+async def main():
+    results = battles()
+    for name, strategy in (("update_one per player", per_player_updates), ("buffered bulk_write", buffered_writer)):
+        await reset()
+        start = time.perf_counter()
+        round_trips = await strategy(results)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>22}: {BATTLES / elapsed:10.0f} results/s  {round_trips} round-trips")
+        failures = await check(results)
+        for failure in failures[:10]:
+            print(f"FAIL: {failure}")
+        if failures:
+            print(f"FAIL: {len(failures)} users have the wrong totals after {name}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+"""Cold-start timing: module import plus the setup_hook warm-up, printed as one JSON line.
+
+Uses the in-memory mongomock stand-in (requires mongomock-motor).
+Run from the repository root: python benchmarks/coldstart.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    start = time.perf_counter()
+    import battle
+    timings = {"import": time.perf_counter() - start}
+    timings.update(asyncio.run(battle.warm_up()))
+    timings["total"] = time.perf_counter() - start
+    print(json.dumps(timings))
+
+
+if __name__ == "__main__":
+    main()
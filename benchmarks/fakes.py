@@ -0,0 +1,91 @@
+"""Stand-ins for discord.py objects and the seeding shared by the benchmark scripts.
+
+Import after setting MONGO_URI to a mongomock:// URI, like the scripts do.
+"""
+import asyncio
+
+import battle
+import database
+from dispatcher import message_router
+
+
+class FakeUser:
+    """Stands in for discord.User; answers battle prompts like a player would."""
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.name = f"user{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bot = False
+        self._options = []
+        self._picked = 0
+
+    async def send(self, content=None, embed=None, embeds=None, **kwargs):
+        if content:
+            self._react(content)
+
+    def _react(self, content):
+        if content.startswith("Select two additional cards from the following: "):
+            self._options = content.split(": ", 1)[1].split(", ")
+            self._picked = 0
+        elif content.startswith("Type the name of the card you want to select"):
+            self._reply(self._options[self._picked])
+            self._picked += 1
+        elif content.startswith("Choose a card and a stat"):
+            self._reply(f"{first_card(content)} rating")
+        elif content.startswith("Choose a card"):
+            self._reply(first_card(content))
+
+    def _reply(self, content):
+        # The prompt registers its waiter right after this send returns, so deliver on a later tick.
+        def deliver():
+            if message_router.is_waiting(self.id):
+                message_router.dispatch(self.id, content)
+            else:
+                asyncio.get_running_loop().call_soon(deliver)
+        asyncio.get_running_loop().call_soon(deliver)
+
+
+def first_card(prompt):
+    return prompt.split("\n")[1].split(" - ")[0]
+
+
+class FakeChannel:
+    id = 1
+    mention = "<#1>"
+
+    async def send(self, content=None, embed=None, **kwargs):
+        pass
+
+
+class FakeContext:
+    """The subset of commands.Context the handlers use; keeps what was sent to the channel."""
+
+    def __init__(self, author, command=None):
+        self.author = author
+        self.command = command
+        self.channel = FakeChannel()
+        self.replies = []
+
+    async def send(self, content=None, embed=None, **kwargs):
+        self.replies.append(content)
+
+
+def profile(user_id, **fields):
+    """A user document with no cards, points or battles, overridden by `fields`."""
+    return {"user_id": str(user_id), "name": f"user{user_id}", "points": 0, "Wins": 0, "Losses": 0, "cards": [], **fields}
+
+
+async def seed(profiles, cards=()):
+    """Replace the users and the market with these documents, then warm up like setup_hook.
+
+    Returns the warm-up timings.
+    """
+    database.connect()
+    await database.users_collection.delete_many({})
+    await database.available_cards_collection.delete_many({})
+    if profiles:
+        await database.users_collection.insert_many(profiles)
+    if cards:
+        await database.available_cards_collection.insert_many(cards)
+    return await battle.warm_up()
@@ -0,0 +1,242 @@
+"""Offline load test for the bot's commands.
+
+Replays concurrent synthetic users against the real command handlers, with a
+fake discord.py context/DM source and the mongomock in-memory Mongo stand-in
+(requires requirements-dev.txt). Reports p50/p99
+latency, throughput and peak memory per command and saves them as JSON.
+
+After every phase the buffered writers (checkpoints, results, event log)
+are flushed, and anything they fail to write is counted as an error.
+
+Timing and memory come from two separate passes over a freshly seeded
+dataset, since tracemalloc slows every allocation and would inflate the
+latencies.
+
+The handlers are called directly rather than through bot.invoke, so the
+global rate-limit check and the before/after-invoke metrics hooks are not
+part of what is measured (the limiter would also shed most synthetic
+traffic); benchmarks/bench_metrics.py times the hooks on their own.
+
+Run from the repository root:
+    python benchmarks/loadtest.py --users 2000 --concurrency 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battle
+from fakes import FakeChannel, FakeContext, FakeUser, profile, seed
+
+
+DEFAULT_OUTPUT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "loadtest.json")
+STARTING_CARDS = 6
+
+
+class FakeUserConverter:
+    async def convert(self, ctx, argument):
+        return USERS[int(argument.strip("<@!>"))]
+
+
+USERS = {}
+
+
+def card_document(card_id):
+    return {
+        "_id": f"card-{card_id}",
+        "name": f"Card {card_id}",
+        "rating": 60 + card_id % 40,
+        "price": 10 + card_id % 90,
+        "agr": card_id % 20,
+        "APPS": card_id % 300,
+        "SV": card_id % 15,
+        "G/A": card_id % 50,
+        "TW": card_id % 10,
+        "image_url": f"https://example.invalid/cards/{card_id}.png"
+    }
+
+
+async def seed_users(users, catalog_size):
+    next_card = 0
+    profiles = []
+    for user_id in range(1, users + 1):
+        cards = [card_document(next_card + i) for i in range(STARTING_CARDS)]
+        next_card += STARTING_CARDS
+        profiles.append(profile(user_id, date="", Wins=user_id % 50, Losses=user_id % 30, cards=cards, visit_count=0))
+        USERS[user_id] = FakeUser(user_id)
+    return await seed(profiles, [card_document(next_card + i) for i in range(catalog_size)])
+
+
+async def flush_writers():
+    """Flush the buffered writers and return how many entries are still unwritten."""
+    writers = (battle.checkpoint_writer, battle.result_writer, battle.event_log)
+    for writer in writers:
+        await writer.flush()
+    return sum(len(writer) for writer in writers)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_command(name, jobs, concurrency, trace_memory=False):
+    """Run every job with bounded concurrency; summarise latency and throughput, or peak memory when tracing."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def timed(job):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await job()
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    if trace_memory:
+        tracemalloc.start()
+        await asyncio.gather(*(timed(job) for job in jobs))
+        unwritten = await flush_writers()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {"command": name, "errors": errors + unwritten, "unwritten": unwritten, "peak_memory_kb": peak / 1024}
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(job) for job in jobs))
+    elapsed = time.perf_counter() - start
+    unwritten = await flush_writers()
+
+    latencies.sort()
+    return {
+        "command": name,
+        "calls": len(jobs),
+        "errors": errors + unwritten,
+        "unwritten": unwritten,
+        "seconds": elapsed,
+        "throughput_per_s": len(jobs) / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None
+    }
+
+
+def roll_jobs(users):
+    return [lambda user=user: battle.give_daily_cards(FakeContext(user, battle.give_daily_cards)) for user in users]
+
+
+def team_jobs(users):
+    return [lambda user=user: battle.show_team_data(FakeContext(user, battle.show_team_data)) for user in users]
+
+
+def battlestats_jobs(users):
+    return [lambda user=user: battle.battlestats(FakeContext(user, battle.battlestats)) for user in users]
+
+
+def sell_jobs(users):
+    return [
+        lambda user=user: battle.sell_card(FakeContext(user, battle.sell_card), card_name=f"Card {(user.id - 1) * STARTING_CARDS}")
+        for user in users
+    ]
+
+
+def battle_jobs(users):
+    async def play(challenger, opponent):
+        await battle.battle(FakeContext(challenger, battle.battle), opponent.mention)
+        await battle.accept(FakeContext(opponent, battle.accept))
+
+    return [lambda a=users[i], b=users[i + 1]: play(a, b) for i in range(0, len(users) - 1, 2)]
+
+
+def queue_jobs(users):
+    return [lambda user=user: battle.queue(FakeContext(user, battle.queue)) for user in users]
+
+
+def phases(users):
+    return (
+        ("roll", roll_jobs(users)),
+        ("team", team_jobs(users)),
+        ("battle", battle_jobs(users)),
+        ("queue", queue_jobs(users)),
+        ("battlestats", battlestats_jobs(users)),
+        ("sell", sell_jobs(users)),
+    )
+
+
+def measure_cold_start():
+    """Time `import battle` plus the setup_hook warm-up in a fresh interpreter."""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "coldstart.py")
+    try:
+        return json.loads(subprocess.check_output([sys.executable, script], text=True).splitlines()[-1])
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+async def main(args):
+    battle.commands.UserConverter = FakeUserConverter
+    battle.bot.get_user = USERS.get
+    battle.bot.get_channel = lambda channel_id: FakeChannel()
+
+    cold_start = measure_cold_start()
+    print(f"cold start: {cold_start}")
+    warm_up = await seed_users(args.users, args.catalog)
+    results = [
+        await run_command(name, jobs, args.concurrency)
+        for name, jobs in phases(list(USERS.values()))
+    ]
+
+    # Memory is measured in a second pass over fresh data, away from the timings.
+    await seed_users(args.users, args.catalog)
+    battle.leaderboard.invalidate()
+    for result, (name, jobs) in zip(results, phases(list(USERS.values()))):
+        memory = await run_command(name, jobs, args.concurrency, trace_memory=True)
+        result["peak_memory_kb"] = memory["peak_memory_kb"]
+        result["memory_pass_errors"] = memory["errors"]
+        print(
+            f"{name:>12}: {result['calls']:>6} calls {result['errors']:>4} errors "
+            f"p50 {result['p50_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+            f"{result['throughput_per_s']:9.1f}/s  peak {result['peak_memory_kb']:9.0f} KiB"
+        )
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "users": args.users,
+        "concurrency": args.concurrency,
+        "catalog": args.catalog,
+        "cold_start": cold_start,
+        "warm_up": warm_up,
+        "commands": results
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--catalog", type=int, default=20000)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    asyncio.run(main(parser.parse_args()))
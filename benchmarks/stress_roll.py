@@ -0,0 +1,85 @@
+"""Concurrency check for !roll: hundreds of simultaneous rolls must respect the daily limit.
+
+Fires ROLLS_PER_USER concurrent !roll commands for each user, half of them
+brand-new players with no profile yet, then checks that:
+  - every user got exactly MAX_DAILY_ROLLS cards and visit_count matches,
+  - no card was handed out twice,
+  - every card is either still on the market or owned by exactly one user.
+
+Uses the in-memory mongomock stand-in (requires mongomock-motor).
+Run from the repository root: python benchmarks/stress_roll.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from collections import Counter
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battle
+import database
+from fakes import FakeContext, FakeUser, profile, seed
+
+
+def market_cards(catalog_size):
+    return [
+        {"_id": f"card-{i}", "name": f"Card {i}", "rating": 70, "price": 10, "image_url": ""}
+        for i in range(catalog_size)
+    ]
+
+
+async def check(users, catalog_size):
+    failures = []
+    owned = Counter()
+    async for user in database.users_collection.find({}):
+        cards = user.get("cards", [])
+        owned.update(card["_id"] for card in cards)
+        if len(cards) != battle.MAX_DAILY_ROLLS or user.get("visit_count") != battle.MAX_DAILY_ROLLS:
+            failures.append(f"user {user['user_id']}: {len(cards)} cards, visit_count {user.get('visit_count')}")
+    profiles = await database.users_collection.count_documents({})
+    if profiles != users:
+        failures.append(f"{profiles} profiles for {users} users")
+
+    duplicates = [card_id for card_id, count in owned.items() if count > 1]
+    if duplicates:
+        failures.append(f"{len(duplicates)} cards owned by more than one user")
+    market = {card["_id"] async for card in database.available_cards_collection.find({}, {"_id": 1})}
+    both = market & set(owned)
+    if both:
+        failures.append(f"{len(both)} owned cards are still on the market")
+    if len(market) + len(owned) != catalog_size:
+        failures.append(f"{catalog_size - len(market) - len(owned)} cards lost")
+    return failures
+
+
+async def main(args):
+    # Even ids already have a profile from an earlier day; odd ids roll for the first time.
+    await seed(
+        [profile(user_id, date="2000-01-01", visit_count=2) for user_id in range(0, args.users, 2)],
+        market_cards(args.catalog)
+    )
+    contexts = [FakeContext(FakeUser(user_id)) for user_id in range(args.users) for _ in range(args.rolls)]
+
+    start = time.perf_counter()
+    await asyncio.gather(*(battle.give_daily_cards(ctx) for ctx in contexts))
+    elapsed = time.perf_counter() - start
+
+    refused = sum(1 for ctx in contexts for reply in ctx.replies if "already received" in (reply or ""))
+    print(f"{len(contexts)} concurrent rolls from {args.users} users in {elapsed:.2f}s, {refused} refused")
+    failures = await check(args.users, args.catalog)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: every user got exactly their daily cards and no card was duplicated or lost.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rolls", type=int, default=6, help="concurrent rolls per user")
+    parser.add_argument("--catalog", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
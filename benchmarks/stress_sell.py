@@ -0,0 +1,96 @@
+"""Concurrency check for !sell: spamming a sell of the same card must pay out once.
+
+Each user fires SELLS_PER_USER concurrent !sell commands for the same card
+and the check confirms that:
+  - the card's price was credited exactly once,
+  - the card left the user's profile,
+  - it was restocked exactly once, in the collection and the in-memory catalog.
+
+Uses the in-memory mongomock stand-in (requires mongomock-motor).
+Run from the repository root: python benchmarks/stress_sell.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+os.environ["MONGO_URI"] = "mongomock://localhost"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import battle
+import database
+from catalog import card_catalog
+from fakes import FakeContext, FakeUser, profile, seed
+
+
+PRICE = 25
+STARTING_POINTS = 100
+
+
+def card_document(user_id, n):
+    return {"_id": f"card-{user_id}-{n}", "name": f"Card {user_id}-{n}", "rating": 70, "price": PRICE, "image_url": ""}
+
+
+async def check(users, restocks):
+    failures = []
+    async for user in database.users_collection.find({}):
+        user_id = user["user_id"]
+        if user["points"] != STARTING_POINTS + PRICE:
+            failures.append(f"user {user_id}: {user['points']} points, expected {STARTING_POINTS + PRICE}")
+        if [card["_id"] for card in user["cards"]] != [f"card-{user_id}-1"]:
+            failures.append(f"user {user_id}: cards left {[card['_id'] for card in user['cards']]}")
+
+    sold = {f"card-{user_id}-0" for user_id in range(users)}
+    market = [card["_id"] async for card in database.available_cards_collection.find({}, {"_id": 1})]
+    if sorted(market) != sorted(sold):
+        failures.append(f"{len(market)} cards on the market, expected {len(sold)}")
+    if len(card_catalog) != len(sold) or any(card_catalog.get(card_id) is None for card_id in sold):
+        failures.append(f"{len(card_catalog)} cards in the catalog, expected {len(sold)}")
+    if restocks != len(sold):
+        failures.append(f"{restocks} restocks, expected {len(sold)}")
+    return failures
+
+
+async def main(args):
+    await seed([
+        profile(user_id, points=STARTING_POINTS, cards=[card_document(user_id, 0), card_document(user_id, 1)])
+        for user_id in range(args.users)
+    ])
+
+    restocks = 0
+    original = database.insert_available_card
+
+    async def counting_insert(card):
+        nonlocal restocks
+        restocks += 1
+        await original(card)
+
+    database.insert_available_card = counting_insert
+    contexts = [FakeContext(FakeUser(user_id)) for user_id in range(args.users) for _ in range(args.sells)]
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(
+            battle.sell_card(ctx, card_name=f"Card {ctx.author.id}-0") for ctx in contexts
+        ))
+    finally:
+        database.insert_available_card = original
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for ctx in contexts for reply in ctx.replies if "successfully sold" in (reply or ""))
+    print(f"{len(contexts)} concurrent sells from {args.users} users in {elapsed:.2f}s, {succeeded} succeeded")
+    failures = await check(args.users, restocks)
+    if succeeded != args.users:
+        failures.append(f"{succeeded} sells reported success, expected {args.users}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK: each card was credited and restocked exactly once.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--sells", type=int, default=10, help="concurrent sells of the same card per user")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,81 @@
+import asyncio
+
+
+STOP_ATTEMPTS = 3
+STOP_BACKOFF = 1.0
+
+class BufferedWriter:
+    """Base for writers that buffer in memory and write to the database in batches.
+
+    Subclasses keep their buffer in `_pending` and supply how a batch is taken
+    from it, written, and put back after a failed write. Flushing happens every
+    `flush_interval` seconds, early once `max_pending` entries are buffered,
+    and on stop.
+    """
+
+    description = "buffered writes"
+
+    def __init__(self, flush_interval, max_pending):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._flush_task = None
+        self._early_flush = None
+        self._flush_lock = asyncio.Lock()
+        self.written_count = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _buffered(self):
+        """Call after adding to the buffer; starts a flush early once it is full."""
+        if len(self._pending) >= self.max_pending:
+            if self._early_flush is None or self._early_flush.done():
+                self._early_flush = asyncio.ensure_future(self.flush())
+
+    def _take_batch(self):
+        raise NotImplementedError
+
+    async def _write(self, batch):
+        raise NotImplementedError
+
+    def _restore(self, batch):
+        raise NotImplementedError
+
+    async def flush(self):
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._take_batch()
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    print(f"Error writing {self.description}: {e}")
+                    # Retry on the next flush rather than dropping the batch.
+                    self._restore(batch)
+                    return
+                self.written_count += len(batch)
+
+    async def _flush_forever(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_forever())
+
+    async def stop(self):
+        """Cancel the periodic flush and write what is left, retrying a failed write.
+
+        Raises RuntimeError if anything is still unwritten after the last attempt,
+        so a shutdown never drops a batch silently.
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        for attempt in range(STOP_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(STOP_BACKOFF * 2 ** (attempt - 1))
+            await self.flush()
+            if not self._pending:
+                return
+        raise RuntimeError(f"{len(self._pending)} {self.description} left unwritten after {STOP_ATTEMPTS} attempts")
@@ -0,0 +1,98 @@
+import random
+import database
+
+
+# Above this many cards the catalog is not mirrored in memory and draws go
+# through a server-side `$sample` instead.
+MAX_INDEXED_CARDS = 50000
+
+
+class CardCatalog:
+    """In-process index of the available_cards collection.
+
+    Listeners are called with a card's _id whenever it is (re)added, and with
+    None after a full reload, so caches derived from card data can drop it.
+    """
+
+    def __init__(self):
+        self._cards = []
+        self._positions = {}
+        self._by_name = {}
+        self.loaded = False
+        self.server_side = False
+        self.listeners = []
+
+    def __len__(self):
+        return len(self._cards)
+
+    async def load(self):
+        """Mirror the available cards, or fall back to `$sample` draws for huge catalogs."""
+        count = await database.count_available_cards()
+        self._cards = []
+        self._positions = {}
+        self._by_name = {}
+        self.server_side = count > MAX_INDEXED_CARDS
+        if not self.server_side:
+            for card in await database.find_available_cards():
+                self.add(card, notify=False)
+        self.loaded = True
+        self._notify(None)
+
+    def _notify(self, card_id):
+        for listener in self.listeners:
+            listener(card_id)
+
+    def add(self, card, notify=True):
+        if notify:
+            self._notify(card["_id"])
+        if card["_id"] in self._positions:
+            return
+        self._positions[card["_id"]] = len(self._cards)
+        self._cards.append(card)
+        self._by_name.setdefault(card["name"].lower(), []).append(card)
+
+    async def restock(self, card):
+        """Return a card to the market: back in the collection and straight into the draw pool."""
+        await database.insert_available_card(card)
+        if self.server_side:
+            self._notify(card["_id"])
+        else:
+            self.add(card)
+
+    def remove(self, card_id):
+        """Remove a card in O(1) by swapping it with the last entry."""
+        position = self._positions.pop(card_id, None)
+        if position is None:
+            return None
+        card = self._cards[position]
+        last = self._cards.pop()
+        if last is not card:
+            self._cards[position] = last
+            self._positions[last["_id"]] = position
+
+        same_name = self._by_name.get(card["name"].lower(), [])
+        same_name[:] = [c for c in same_name if c["_id"] != card_id]
+        if not same_name:
+            self._by_name.pop(card["name"].lower(), None)
+        return card
+
+    def get(self, card_id):
+        position = self._positions.get(card_id)
+        return None if position is None else self._cards[position]
+
+    def find_by_name(self, name):
+        cards = self._by_name.get(name.lower())
+        return cards[0] if cards else None
+
+    async def draw(self):
+        """Pick a random available card without removing it."""
+        if not self.loaded:
+            await self.load()
+        if self.server_side:
+            return await database.sample_available_card()
+        if not self._cards:
+            return None
+        return random.choice(self._cards)
+
+
+card_catalog = CardCatalog()
@@ -0,0 +1,69 @@
+from datetime import datetime, timezone
+from pymongo import DeleteOne, ReplaceOne
+import database
+from buffered import BufferedWriter
+from coordination import PROCESS_ID
+
+
+FLUSH_INTERVAL = 2.0
+MAX_PENDING = 200
+
+
+def card_ids(cards):
+    return [card.id for card in cards]
+
+
+class CheckpointWriter(BufferedWriter):
+    """Buffers the latest state of each battle and writes it to the battles collection in batches.
+
+    Only the newest checkpoint per battle is kept between flushes, so a busy
+    battle costs at most one write per flush interval.
+    """
+
+    description = "battle checkpoints"
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_pending=MAX_PENDING):
+        super().__init__(flush_interval, max_pending)
+        self._pending = {}
+
+    def save(self, battle, stage, round_num=0, userA_hand=None, userB_hand=None, userA_score=0, userB_score=0):
+        """Queue a compact checkpoint for `battle`."""
+        self._pending[battle["battle_id"]] = {
+            "_id": battle["battle_id"],
+            "a": battle["userA_id"],
+            "b": battle["userB_id"],
+            "o": PROCESS_ID,
+            "c": battle.get("channel_id"),
+            "ha": card_ids(userA_hand if userA_hand is not None else battle["userA_cards"]),
+            "hb": card_ids(userB_hand if userB_hand is not None else battle["userB_cards"]),
+            "st": battle["status"],
+            "p": stage,
+            "r": round_num,
+            "sa": userA_score,
+            "sb": userB_score,
+            "t": datetime.now(timezone.utc)
+        }
+        self._buffered()
+
+    def discard(self, battle_id):
+        """Queue removal of a finished battle's checkpoint."""
+        self._pending[battle_id] = None
+
+    def _take_batch(self):
+        batch, self._pending = self._pending, {}
+        return batch
+
+    async def _write(self, batch):
+        await database.write_battle_checkpoints([
+            DeleteOne({"_id": battle_id}) if doc is None
+            else ReplaceOne({"_id": battle_id}, doc, upsert=True)
+            for battle_id, doc in batch.items()
+        ])
+
+    def _restore(self, batch):
+        # Keep anything newer that arrived while we were writing.
+        for battle_id, doc in batch.items():
+            self._pending.setdefault(battle_id, doc)
+
+
+checkpoint_writer = CheckpointWriter()
@@ -0,0 +1,212 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from pymongo.errors import DuplicateKeyError
+import database
+
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", 0)) or None
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()] or None
+# Stable across restarts of the same shard slice, so a process can find its own leftovers.
+PROCESS_ID = os.getenv("PROCESS_ID") or (
+    "shards-" + "-".join(map(str, SHARD_IDS)) if SHARD_IDS else "single"
+)
+
+
+class InMemoryPubSub:
+    """Pub/sub within one process; the stand-in for single-process runs and offline testing."""
+
+    def __init__(self):
+        self._handlers = {}
+
+    def subscribe(self, channel, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel, payload):
+        for handler in self._handlers.get(channel, []):
+            asyncio.ensure_future(handler(payload))
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class MongoPubSub:
+    """Pub/sub across processes: publish inserts an event, subscribers tail a change stream.
+
+    Change streams need MongoDB running as a replica set.
+    """
+
+    def __init__(self, process_id=PROCESS_ID):
+        self.process_id = process_id
+        self._handlers = {}
+        self._watch_task = None
+
+    def subscribe(self, channel, handler):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def publish(self, channel, payload):
+        await database.insert_coordination_event({
+            "channel": channel,
+            "payload": payload,
+            "origin": self.process_id,
+            "at": datetime.now(timezone.utc)
+        })
+
+    async def _watch(self):
+        pipeline = [{"$match": {
+            "operationType": "insert",
+            "fullDocument.channel": {"$in": list(self._handlers)}
+        }}]
+        while True:
+            try:
+                async with database.watch_coordination_events(pipeline) as stream:
+                    async for change in stream:
+                        event = change["fullDocument"]
+                        for handler in self._handlers.get(event["channel"], []):
+                            asyncio.ensure_future(handler(event["payload"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Coordination change stream failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    async def start(self):
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+
+class InMemoryChallengeStore:
+    """Which process owns each battle, for single-process runs and offline testing."""
+
+    def __init__(self):
+        self._challenges = {}
+        self._by_player = {}
+
+    async def claim(self, battle, owner, channel_id):
+        """Record a new challenge; False if either player is already in a battle anywhere."""
+        players = (battle["userA_id"], battle["userB_id"])
+        if any(player in self._by_player for player in players):
+            return False
+        self._challenges[battle["battle_id"]] = {
+            "_id": battle["battle_id"], "a": players[0], "b": players[1],
+            "owner": owner, "channel_id": channel_id, "status": "pending"
+        }
+        for player in players:
+            self._by_player[player] = battle["battle_id"]
+        return True
+
+    async def pending_for_opponent(self, user_id):
+        challenge = self._challenges.get(self._by_player.get(user_id))
+        if challenge and challenge["b"] == user_id and challenge["status"] == "pending":
+            return challenge
+        return None
+
+    async def release(self, battle_id):
+        challenge = self._challenges.pop(battle_id, None)
+        if challenge:
+            for player in (challenge["a"], challenge["b"]):
+                self._by_player.pop(player, None)
+
+    async def release_owned_by(self, owner, keep=()):
+        for battle_id, challenge in list(self._challenges.items()):
+            if challenge["owner"] == owner and battle_id not in keep:
+                await self.release(battle_id)
+
+
+class MongoChallengeStore:
+    """Challenge ownership shared by every process through the challenges collection.
+
+    A unique multikey index on the players array makes "either player is
+    already battling" a single atomic insert.
+    """
+
+    async def claim(self, battle, owner, channel_id):
+        try:
+            await database.insert_challenge({
+                "_id": battle["battle_id"],
+                "a": battle["userA_id"],
+                "b": battle["userB_id"],
+                "players": [battle["userA_id"], battle["userB_id"]],
+                "owner": owner,
+                "channel_id": channel_id,
+                "status": "pending",
+                "at": datetime.now(timezone.utc)
+            })
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def pending_for_opponent(self, user_id):
+        return await database.find_pending_challenge(user_id)
+
+    async def release(self, battle_id):
+        await database.delete_challenge(battle_id)
+
+    async def release_owned_by(self, owner, keep=()):
+        await database.delete_challenges_owned_by(owner, list(keep))
+
+
+class Coordinator:
+    """Lets battles span processes when the bot runs as several sharded processes.
+
+    The process that handled `!battle` owns the battle and runs its rounds.
+    `!accept` received elsewhere is forwarded to the owner, and DM replies
+    (which Discord delivers only to shard 0) are forwarded to whichever
+    process is waiting on that player. Changes to the in-memory caches (the
+    card catalog and the leaderboard) are broadcast so every process can
+    apply them to its own copy.
+    """
+
+    def __init__(self, pubsub, store, process_id=PROCESS_ID):
+        self.pubsub = pubsub
+        self.store = store
+        self.process_id = process_id
+        self.forwarded_count = 0
+
+    def subscribe(self, on_accept, on_message, on_cache):
+        """Register the handlers; must happen before start(), which watches only the channels known then."""
+        self.pubsub.subscribe(f"accept:{self.process_id}", on_accept)
+        self.pubsub.subscribe("dm", on_message)
+        self.pubsub.subscribe("cache", on_cache)
+
+    async def start(self):
+        await self.pubsub.start()
+
+    async def stop(self):
+        await self.pubsub.stop()
+
+    async def claim(self, battle, channel_id):
+        return await self.store.claim(battle, self.process_id, channel_id)
+
+    async def release(self, battle_id):
+        await self.store.release(battle_id)
+
+    async def forward_accept(self, challenge, user_id, channel_id):
+        self.forwarded_count += 1
+        await self.pubsub.publish(f"accept:{challenge['owner']}", {
+            "battle_id": challenge["_id"], "user_id": user_id, "channel_id": channel_id
+        })
+
+    async def forward_message(self, author_id, content):
+        self.forwarded_count += 1
+        await self.pubsub.publish("dm", {"author_id": author_id, "content": content, "origin": self.process_id})
+
+    async def publish_cache_event(self, event, **fields):
+        await self.pubsub.publish("cache", {"event": event, "origin": self.process_id, **fields})
+
+
+def create_coordinator():
+    if SHARD_COUNT:
+        return Coordinator(MongoPubSub(), MongoChallengeStore())
+    return Coordinator(InMemoryPubSub(), InMemoryChallengeStore())
+
+
+coordinator = create_coordinator()
@@ -0,0 +1,300 @@
+import os
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import CollectionInvalid, DuplicateKeyError
+from metrics import MongoCommandTimer, metrics
+
+load_dotenv()
+
+
+DB_NAME = "beingSarangi"
+MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+CHALLENGE_RETENTION = 2 * 60 * 60
+EVENT_RETENTION = 60 * 60
+
+
+def make_client(uri):
+    """Create an async Mongo client, or an in-memory one for `mongomock://` URIs."""
+    if uri and uri.startswith("mongomock://"):
+        # Local stand-in for offline runs; only needed when explicitly requested.
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    return AsyncIOMotorClient(uri, maxPoolSize=MAX_POOL_SIZE, event_listeners=[MongoCommandTimer(metrics)])
+
+
+# Set by connect(); nothing touches the network at import time.
+client = None
+db = None
+users_collection = None
+available_cards_collection = None
+battles_collection = None
+challenges_collection = None
+coordination_events_collection = None
+events_collection = None
+
+
+def connect(uri=None):
+    """Create the client and collection handles on first use; motor connects lazily on the first operation."""
+    global client, db, users_collection, available_cards_collection, battles_collection
+    global challenges_collection, coordination_events_collection, events_collection
+    if client is None:
+        client = make_client(uri or os.getenv("MONGO_URI"))
+        db = client[DB_NAME]
+        users_collection = db.users
+        available_cards_collection = db.available_cards
+        battles_collection = db.battles
+        challenges_collection = db.challenges
+        coordination_events_collection = db.coordination_events
+        events_collection = db.events
+    return db
+
+
+def close():
+    global client
+    if client is not None:
+        client.close()
+        client = None
+
+
+async def find_duplicate_users(limit=20):
+    """user_ids that have more than one profile."""
+    pipeline = [
+        {"$group": {"_id": "$user_id", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": limit}
+    ]
+    return [group["_id"] async for group in users_collection.aggregate(pipeline)]
+
+
+async def ensure_indexes():
+    # The unique key lets conditional upserts fail instead of duplicating a user.
+    # Profiles duplicated before it existed make the build fail; that is reported
+    # rather than stopping startup, since merging them needs a person to decide
+    # which cards and points to keep. Remove the extra profiles and restart.
+    try:
+        await users_collection.create_index("user_id", unique=True)
+    except DuplicateKeyError:
+        duplicates = await find_duplicate_users()
+        print(f"Could not create the unique user_id index; duplicate profiles for: {', '.join(map(str, duplicates))}")
+    await users_collection.create_index([("Wins", DESCENDING), ("user_id", ASCENDING)])
+    # A player can appear in at most one challenge across all processes.
+    await challenges_collection.create_index("players", unique=True)
+    await challenges_collection.create_index("b")
+    await challenges_collection.create_index("at", expireAfterSeconds=CHALLENGE_RETENTION)
+    await coordination_events_collection.create_index("at", expireAfterSeconds=EVENT_RETENTION)
+
+
+async def find_user(user_id, projection=None):
+    return await users_collection.find_one({"user_id": user_id}, projection)
+
+
+async def find_users(user_ids, projection=None):
+    return await users_collection.find({"user_id": {"$in": list(user_ids)}}, projection).to_list(length=None)
+
+
+async def insert_user(user_profile):
+    await users_collection.insert_one(user_profile)
+
+
+async def update_user(user_id, update, upsert=False):
+    return await users_collection.update_one({"user_id": user_id}, update, upsert=upsert)
+
+
+async def find_available_cards():
+    return await available_cards_collection.find({}).to_list(length=None)
+
+
+async def delete_available_card(card_id):
+    await available_cards_collection.delete_one({"_id": card_id})
+
+
+async def insert_available_card(card):
+    await available_cards_collection.insert_one(card)
+
+
+async def count_available_cards():
+    return await available_cards_collection.estimated_document_count()
+
+
+async def sample_available_card():
+    """Draw one random card server-side, for catalogs too large to index locally."""
+    cards = await available_cards_collection.aggregate([{"$sample": {"size": 1}}]).to_list(length=1)
+    return cards[0] if cards else None
+
+
+async def claim_available_card(card_id):
+    """Atomically take a card out of the catalog; returns None if someone else got it first."""
+    return await available_cards_collection.find_one_and_delete({"_id": card_id})
+
+
+async def reserve_daily_roll(user_id, name, today, max_rolls):
+    """Use up one of today's rolls, creating the profile if needed, before any card is claimed.
+
+    Returns the updated profile, or None when today's rolls are used up.
+
+    The roll is spent before the card is claimed and the card is claimed
+    before it is granted. If the process dies between claim_available_card
+    and grant_card, that card is off the market and owned by no one, and the
+    roll stays used; the roll event is never logged, so the event log shows
+    which cards went missing that way.
+    """
+    query = {"user_id": user_id, "$or": [{"date": {"$ne": today}}, {"visit_count": {"$lt": max_rolls}}]}
+    update = [{"$set": {
+        "name": {"$ifNull": ["$name", name]},
+        "points": {"$ifNull": ["$points", 0]},
+        "wins": {"$ifNull": ["$wins", 0]},
+        "losses": {"$ifNull": ["$losses", 0]},
+        "cards": {"$ifNull": ["$cards", []]},
+        "visit_count": {"$cond": [{"$eq": ["$date", today]}, {"$add": ["$visit_count", 1]}, 1]},
+        "date": today,
+    }}]
+    try:
+        return await users_collection.find_one_and_update(
+            query, update, projection={"visit_count": 1}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Only a first-ever roll racing another one gets here: the server won't
+        # retry an upsert whose filter has an $or. The profile exists now, so
+        # the filter alone decides, and None means no rolls are left.
+        return await users_collection.find_one_and_update(
+            query, update, projection={"visit_count": 1}, return_document=ReturnDocument.AFTER
+        )
+
+
+async def release_daily_roll(user_id, today):
+    """Give back a roll reserved today when no card could be claimed for it."""
+    await users_collection.update_one(
+        {"user_id": user_id, "date": today, "visit_count": {"$gt": 0}},
+        {"$inc": {"visit_count": -1}}
+    )
+
+
+async def grant_card(user_id, card):
+    await users_collection.update_one({"user_id": user_id}, {"$push": {"cards": card}})
+
+
+def ranked_after(boundary):
+    """Filter for users ranked below `boundary`, the (Wins, user_id) of an earlier row.
+
+    Users without a Wins field sort last, after every numeric value.
+    """
+    if boundary is None:
+        return {}
+    wins, user_id = boundary
+    if wins is None:
+        return {"Wins": None, "user_id": {"$gt": user_id}}
+    return {"$or": [
+        {"Wins": {"$lt": wins}},
+        {"Wins": wins, "user_id": {"$gt": user_id}},
+        {"Wins": None}
+    ]}
+
+
+async def find_top_users(after, skip, limit):
+    """Leaderboard rows ranked below `after` (None for the top), read as a range of the (Wins, user_id) index."""
+    cursor = users_collection.find(
+        ranked_after(after),
+        {"_id": 0, "user_id": 1, "name": 1, "Wins": 1, "Losses": 1}
+    ).sort([("Wins", DESCENDING), ("user_id", ASCENDING)]).skip(skip).limit(limit)
+    return await cursor.to_list(length=limit)
+
+
+async def count_users():
+    return await users_collection.estimated_document_count()
+
+
+def ranked_before(boundary):
+    """Filter for users ranked above `boundary`, in the same order as ranked_after."""
+    wins, user_id = boundary
+    if wins is None:
+        return {"$or": [{"Wins": {"$ne": None}}, {"Wins": None, "user_id": {"$lt": user_id}}]}
+    return {"$or": [
+        {"Wins": {"$gt": wins}},
+        {"Wins": wins, "user_id": {"$lt": user_id}}
+    ]}
+
+
+async def count_users_ranked_before(boundary):
+    return await users_collection.count_documents(ranked_before(boundary))
+
+
+async def write_battle_checkpoints(operations):
+    await battles_collection.bulk_write(operations, ordered=False)
+
+
+async def find_battle_checkpoints(owner):
+    return await battles_collection.find({"o": owner}).to_list(length=None)
+
+
+async def write_user_results(operations):
+    await users_collection.bulk_write(operations, ordered=False)
+
+
+async def sell_user_card(user_id, card_id, price):
+    """Atomically remove a card the user still owns and credit its price.
+
+    Returns the updated profile, or None if the card was already gone.
+    """
+    return await users_collection.find_one_and_update(
+        {"user_id": user_id, "cards._id": card_id},
+        {"$pull": {"cards": {"_id": card_id}}, "$inc": {"points": price}},
+        projection={"points": 1},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def insert_challenge(challenge):
+    await challenges_collection.insert_one(challenge)
+
+
+async def find_pending_challenge(user_id):
+    return await challenges_collection.find_one({"b": user_id, "status": "pending"})
+
+
+async def delete_challenge(battle_id):
+    await challenges_collection.delete_one({"_id": battle_id})
+
+
+async def delete_challenges_owned_by(owner, keep):
+    await challenges_collection.delete_many({"owner": owner, "_id": {"$nin": keep}})
+
+
+async def insert_coordination_event(event):
+    await coordination_events_collection.insert_one(event)
+
+
+def watch_coordination_events(pipeline):
+    return coordination_events_collection.watch(pipeline)
+
+
+async def find_owned_cards():
+    cursor = users_collection.aggregate([{"$unwind": "$cards"}, {"$replaceRoot": {"newRoot": "$cards"}}])
+    return await cursor.to_list(length=None)
+
+
+async def ensure_event_log(size):
+    """Create the capped events collection if it does not exist yet; True if this call created it."""
+    if "events" in await db.list_collection_names():
+        return False
+    try:
+        await db.create_collection("events", capped=True, size=size)
+    except CollectionInvalid:
+        return False
+    except NotImplementedError:
+        # The mongomock stand-in has no capped collections; an ordinary one is enough offline.
+        await db.create_collection("events")
+    return True
+
+
+async def insert_events(events):
+    await events_collection.insert_many(events, ordered=False)
+
+
+def stream_events(batch_size):
+    """Cursor over the event log in insertion order."""
+    return events_collection.find({}, sort=[("$natural", ASCENDING)], batch_size=batch_size)
+
+
+def stream_users(projection, batch_size):
+    return users_collection.find({}, projection, batch_size=batch_size)
@@ -0,0 +1,108 @@
+import asyncio
+import contextlib
+import random
+
+
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_RETRIES = 5
+BASE_BACKOFF = 1.0
+
+
+def chunk(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def retry_delay(error, attempt):
+    """Delay before retrying a rate-limited send, or None if the error isn't a rate limit."""
+    if getattr(error, "status", None) != 429:
+        return None
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after = headers.get("Retry-After")
+    if retry_after is not None:
+        return float(retry_after)
+    return BASE_BACKOFF * 2 ** attempt + random.uniform(0, BASE_BACKOFF)
+
+
+async def discord_transport(destination, content=None, embeds=None, file=None):
+    if file is not None:
+        return await destination.send(content=content, embeds=embeds or None, file=file)
+    return await destination.send(content=content, embeds=embeds or None)
+
+
+class Delivery:
+    """Outbound message layer: packs embeds into as few messages as possible.
+
+    Sends to the same destination go out one at a time and in order, so a
+    rate-limited DM channel backs off without holding up other users.
+    """
+
+    def __init__(self, transport=discord_transport, max_retries=MAX_RETRIES):
+        self.transport = transport
+        self.max_retries = max_retries
+        self._locks = {}
+        self._users = {}
+        self.sent_count = 0
+        self.rate_limited_count = 0
+
+    def _key(self, destination):
+        return getattr(destination, "id", id(destination))
+
+    async def _send_with_backoff(self, destination, content, embeds, **extra):
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = await self.transport(destination, content=content, embeds=embeds, **extra)
+                self.sent_count += 1
+                return result
+            except Exception as e:
+                delay = retry_delay(e, attempt)
+                if delay is None or attempt == self.max_retries:
+                    raise
+                self.rate_limited_count += 1
+                await asyncio.sleep(delay)
+                if "file" in extra:
+                    extra["file"].reset()
+
+    async def send(self, destination, content=None, embeds=None):
+        """Send a single message, queued behind earlier sends to the same destination."""
+        return (await self.send_many(destination, [(content, embeds)]))[0]
+
+    @contextlib.asynccontextmanager
+    async def _queued(self, destination):
+        key = self._key(destination)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    async def send_many(self, destination, messages):
+        """Send (content, embeds) pairs in order to one destination."""
+        async with self._queued(destination):
+            return [
+                await self._send_with_backoff(destination, content, embeds)
+                for content, embeds in messages
+            ]
+
+    async def send_file(self, destination, file, content=None, embeds=None):
+        """Send one message with a file attachment, queued like any other send."""
+        async with self._queued(destination):
+            return await self._send_with_backoff(destination, content, embeds, file=file)
+
+    async def send_embeds(self, destination, embeds, content=None):
+        """Send embeds packed up to ten per message; `content` goes on the first message."""
+        messages = [
+            (content if i == 0 else None, batch)
+            for i, batch in enumerate(chunk(embeds, MAX_EMBEDS_PER_MESSAGE))
+        ]
+        return await self.send_many(destination, messages)
+
+
+delivery = Delivery()
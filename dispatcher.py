@@ -0,0 +1,62 @@
+import asyncio
+
+
+class InvalidInput(Exception):
+    """Raised by a parser to reject a message; the text is sent back to the author."""
+
+
+def hand_index(cards):
+    """Index a hand by lowercase card name for O(1) lookups of typed names."""
+    return {card.key: card for card in cards}
+
+
+class MessageRouter:
+    """Routes DMs to the one prompt waiting on their author.
+
+    Each incoming message costs a single dict lookup no matter how many
+    battles are waiting, instead of running every pending `wait_for` check.
+    """
+
+    def __init__(self):
+        self._waiting = {}
+
+    def __len__(self):
+        return len(self._waiting)
+
+    def is_waiting(self, user_id):
+        return user_id in self._waiting
+
+    async def wait_for(self, user_id, parse, timeout=None):
+        """Wait for the next DM from `user_id` that `parse` accepts and return the parsed value."""
+        if user_id in self._waiting:
+            raise RuntimeError(f"Already waiting for a message from {user_id}")
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (future, parse)
+        self._waiting[user_id] = waiter
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            if self._waiting.get(user_id) is waiter:
+                del self._waiting[user_id]
+
+    def dispatch(self, author_id, content):
+        """Offer a DM to its waiter; returns a reply to send back, if any."""
+        waiter = self._waiting.get(author_id)
+        if waiter is None:
+            return None
+
+        future, parse = waiter
+        if future.done():
+            return None
+        try:
+            value = parse(content.strip())
+        except InvalidInput as e:
+            return str(e)
+
+        del self._waiting[author_id]
+        future.set_result(value)
+        return None
+
+
+message_router = MessageRouter()
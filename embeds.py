@@ -0,0 +1,222 @@
+import asyncio
+import io
+from collections import OrderedDict
+import aiohttp
+import discord
+
+try:
+    from PIL import Image, ImageDraw
+except ImportError:
+    Image = None
+
+
+MAX_EMBEDS = 5000
+MAX_EMBED_BYTES = 4 * 1024 * 1024
+MAX_THUMBNAIL_BYTES = 32 * 1024 * 1024
+THUMBNAIL_SIZE = (160, 224)
+CAPTION_HEIGHT = 24
+GRID_COLUMNS = 5
+IMAGE_FETCH_TIMEOUT = 10
+
+
+def embed_size(embed):
+    return len(embed.title or "") + len(embed.description or "") + len(embed.image.url or "")
+
+
+class EmbedCache:
+    """LRU of built card embeds keyed by (style, card _id, version), bounded by count and size."""
+
+    def __init__(self, max_entries=MAX_EMBEDS, max_bytes=MAX_EMBED_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._keys_by_card = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, style, card_id, version, build):
+        """Return the cached embed for this card, building it with `build()` on a miss."""
+        if card_id is None:
+            return build()
+        key = (style, card_id, version)
+        embed = self._entries.get(key)
+        if embed is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embed
+
+        self.misses += 1
+        embed = build()
+        self._entries[key] = embed
+        self._keys_by_card.setdefault(card_id, set()).add(key)
+        self.size += embed_size(embed)
+        while self._entries and (len(self._entries) > self.max_entries or self.size > self.max_bytes):
+            self._evict(next(iter(self._entries)))
+        return embed
+
+    def _evict(self, key):
+        embed = self._entries.pop(key)
+        self.size -= embed_size(embed)
+        keys = self._keys_by_card.get(key[1])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_card[key[1]]
+
+    def invalidate(self, card_id):
+        for key in list(self._keys_by_card.get(card_id, ())):
+            self._evict(key)
+
+    def catalog_changed(self, card_id):
+        """Catalog listener: drop one card's embeds, or everything after a full reload."""
+        if card_id is None:
+            self.clear()
+        else:
+            self.invalidate(card_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._keys_by_card.clear()
+        self.size = 0
+
+
+embed_cache = EmbedCache()
+
+
+def card_version(document):
+    return document.get("version", 0)
+
+
+def card_summary_embed(card):
+    """Name, rating and image; used when showing battle hands."""
+    def build():
+        embed = discord.Embed(
+            title=card.name,
+            description=f"Rating: {card.document.get('rating')}",
+            color=discord.Color.blue()
+        )
+        if card.image_url:
+            embed.set_image(url=card.image_url)
+        return embed
+    return embed_cache.get("summary", card.id, card_version(card.document), build)
+
+
+def card_detail_embed(document):
+    """Full card details, as shown when a player picks a card."""
+    def build():
+        embed = discord.Embed(
+            title=document["name"],
+            description=(
+                f"Rating: {document['rating']}\n"
+                f"Price: {document['price']}\n"
+                f"AGR: {document['agr']}\n"
+                f"Apps: {document.get('APPS', 'N/A')}"
+            ),
+            color=discord.Color.blue()
+        )
+        if document.get("image_url"):
+            embed.set_image(url=document["image_url"])
+        return embed
+    return embed_cache.get("detail", document.get("_id"), card_version(document), build)
+
+
+def team_card_embed(document):
+    """Rating and price, as listed by !team."""
+    def build():
+        embed = discord.Embed(
+            title=f"{document.get('name', 'Unknown Card')}",
+            description=f"Rating: {document.get('rating', 'N/A')}\nPrice: {document.get('price', 'N/A')}",
+            color=discord.Color.blue()
+        )
+        if document.get("image_url"):
+            embed.set_image(url=document["image_url"])
+        return embed
+    return embed_cache.get("team", document.get("_id"), card_version(document), build)
+
+
+class TeamGridRenderer:
+    """Composites a page of card images into one PNG with Pillow.
+
+    Card images are downloaded once and kept as thumbnails in an LRU bounded
+    by bytes; compositing runs in a worker thread off the event loop.
+    """
+
+    def __init__(self, max_bytes=MAX_THUMBNAIL_BYTES):
+        self.max_bytes = max_bytes
+        self._thumbnails = OrderedDict()
+        self.size = 0
+        self._session = None
+
+    @property
+    def available(self):
+        return Image is not None
+
+    async def _thumbnail(self, url):
+        thumbnail = self._thumbnails.get(url)
+        if thumbnail is not None:
+            self._thumbnails.move_to_end(url)
+            return thumbnail
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=IMAGE_FETCH_TIMEOUT))
+        try:
+            async with self._session.get(url) as response:
+                response.raise_for_status()
+                data = await response.read()
+        except Exception as e:
+            print(f"Could not fetch card image {url}: {e}")
+            return None
+
+        thumbnail = await asyncio.to_thread(self._make_thumbnail, data)
+        self._thumbnails[url] = thumbnail
+        self.size += len(thumbnail.tobytes())
+        while self._thumbnails and self.size > self.max_bytes:
+            _, evicted = self._thumbnails.popitem(last=False)
+            self.size -= len(evicted.tobytes())
+        return thumbnail
+
+    @staticmethod
+    def _make_thumbnail(data):
+        image = Image.open(io.BytesIO(data)).convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE)
+        return image
+
+    @staticmethod
+    def _composite(cards, thumbnails):
+        width, height = THUMBNAIL_SIZE
+        rows = -(-len(cards) // GRID_COLUMNS)
+        columns = min(len(cards), GRID_COLUMNS)
+        grid = Image.new("RGB", (columns * width, rows * (height + CAPTION_HEIGHT)), (32, 34, 37))
+        draw = ImageDraw.Draw(grid)
+        for i, (card, thumbnail) in enumerate(zip(cards, thumbnails)):
+            x = (i % GRID_COLUMNS) * width
+            y = (i // GRID_COLUMNS) * (height + CAPTION_HEIGHT)
+            if thumbnail is not None:
+                grid.paste(thumbnail, (x + (width - thumbnail.width) // 2, y + (height - thumbnail.height) // 2))
+            caption = f"{card.get('name', 'Unknown Card')} ({card.get('rating', 'N/A')})"
+            draw.text((x + 4, y + height + 4), caption[:26], fill=(255, 255, 255))
+        buffer = io.BytesIO()
+        grid.save(buffer, format="PNG", optimize=True)
+        buffer.seek(0)
+        return buffer
+
+    async def render(self, cards, filename="team.png"):
+        """Return a discord.File with the grid for these card documents."""
+        thumbnails = await asyncio.gather(*(
+            self._thumbnail(card["image_url"]) if card.get("image_url") else asyncio.sleep(0)
+            for card in cards
+        ))
+        buffer = await asyncio.to_thread(self._composite, cards, thumbnails)
+        return discord.File(buffer, filename=filename)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+team_grid = TeamGridRenderer()
@@ -0,0 +1,135 @@
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime, timezone
+from pymongo.errors import BulkWriteError
+import database
+from buffered import BufferedWriter
+
+
+# "mongo" for the capped events collection, "off", or the path of a JSONL file.
+EVENT_LOG = os.getenv("EVENT_LOG", "mongo")
+FLUSH_INTERVAL = 1.0
+MAX_BATCH = 1000
+MAX_QUEUED = 100000
+CAPPED_SIZE = 512 * 1024 * 1024
+MAX_FILE_BYTES = 100 * 1024 * 1024
+BACKUP_COUNT = 10
+# First event of a new log. Replay only trusts a log whose oldest event is
+# still this marker: a capped collection that has wrapped, or a JSONL log
+# that has rotated past its last backup, will have lost it.
+LOG_START = "log_start"
+
+
+class MongoEventSink:
+    """Writes batches to a capped collection, which keeps the newest events within a fixed size."""
+
+    def __init__(self, capped_size=CAPPED_SIZE):
+        self.capped_size = capped_size
+
+    async def prepare(self):
+        """Create the collection if needed; True if the log is new."""
+        return await database.ensure_event_log(self.capped_size)
+
+    async def write(self, events):
+        try:
+            await database.insert_events(events)
+        except BulkWriteError as e:
+            # A retried batch may be partly written already; those duplicates are fine.
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+
+def json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class JsonlEventSink:
+    """Appends batches to a JSONL file, rotated like logging's RotatingFileHandler.
+
+    `path.1` is the most recent backup and `path.<backup_count>` the oldest.
+    """
+
+    def __init__(self, path, max_bytes=MAX_FILE_BYTES, backup_count=BACKUP_COUNT):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+
+    async def prepare(self):
+        """Create the log directory if needed; True if the log is new."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+        return not (os.path.exists(self.path) or os.path.exists(f"{self.path}.1"))
+
+    async def write(self, events):
+        data = "".join(json.dumps(event, default=json_default, separators=(",", ":")) + "\n" for event in events)
+        await asyncio.to_thread(self._append, data.encode())
+
+    def _append(self, data):
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(data) > self.max_bytes:
+            self._rotate()
+        with open(self.path, "ab") as f:
+            f.write(data)
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+
+class EventLog(BufferedWriter):
+    """Queues structured events (rolls, sells, battle rounds, results) and writes them in batches.
+
+    log() only appends to a queue, so command handlers never wait on the
+    sink. If the sink falls behind by more than `max_queued` events, the
+    oldest are dropped rather than letting the queue grow without bound.
+    """
+
+    description = "event log"
+
+    def __init__(self, sink, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH, max_queued=MAX_QUEUED):
+        super().__init__(flush_interval, max_batch)
+        self.sink = sink
+        self.max_queued = max_queued
+        self._pending = deque()
+        self._prepared = False
+        self.dropped_count = 0
+
+    def log(self, event_type, **fields):
+        if self.sink is None:
+            return
+        self._pending.append({"type": event_type, "at": datetime.now(timezone.utc), **fields})
+        if len(self._pending) > self.max_queued:
+            self._pending.popleft()
+            self.dropped_count += 1
+        self._buffered()
+
+    def _take_batch(self):
+        return [self._pending.popleft() for _ in range(min(self.max_pending, len(self._pending)))]
+
+    async def _write(self, batch):
+        if not self._prepared:
+            if await self.sink.prepare():
+                batch.insert(0, {"type": LOG_START, "at": datetime.now(timezone.utc)})
+            self._prepared = True
+        await self.sink.write(batch)
+
+    def _restore(self, batch):
+        self._pending.extendleft(reversed(batch))
+
+    def start(self):
+        if self.sink is not None:
+            super().start()
+
+
+def create_event_log():
+    if EVENT_LOG == "off":
+        return EventLog(None)
+    if EVENT_LOG == "mongo":
+        return EventLog(MongoEventSink())
+    return EventLog(JsonlEventSink(EVENT_LOG))
+
+
+event_log = create_event_log()
@@ -0,0 +1,97 @@
+import math
+from prettytable import PrettyTable
+import database
+
+
+PAGE_SIZE = 10
+# Only the top MAX_PAGES pages are reachable, which bounds how far a page fetch ever has to skip.
+MAX_PAGES = 100
+TROPHIES = {1: "🏆", 2: "🥈", 3: "🥉"}
+
+
+def render_table(rows, first_rank):
+    table = PrettyTable()
+    table.field_names = ["Rank", "User", "W", "L", "MP"]
+
+    table.align["Rank"] = "l"
+    table.align["User"] = "l"
+    table.align["W"] = "r"
+    table.align["L"] = "r"
+    table.align["MP"] = "r"
+
+    for rank, user in enumerate(rows, start=first_rank):
+        wins = user.get("Wins", 0)
+        losses = user.get("Losses", 0)
+        trophy = TROPHIES.get(rank, "")
+        table.add_row([f"{trophy} {rank}", user.get("name", "Unknown")[:15], wins, losses, wins + losses])
+
+    return table.get_string()
+
+
+class Leaderboard:
+    """Paged battle leaderboard with rendered pages cached until the next result is saved.
+
+    Pages are read by key: the (Wins, user_id) of the last row on each page
+    is remembered, and the next page is the index range after it, so paging
+    through in order never skips index keys. Jumping ahead skips only from
+    the nearest page already seen.
+
+    Listeners are called after invalidate(notify=True), so other processes
+    can be told to drop their copy.
+    """
+
+    def __init__(self, page_size=PAGE_SIZE, max_pages=MAX_PAGES):
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self._pages = {}
+        self._boundaries = {0: None}
+        self._page_count = None
+        self._ranks = {}
+        self.listeners = []
+
+    def invalidate(self, notify=True):
+        self._pages.clear()
+        self._boundaries = {0: None}
+        self._page_count = None
+        self._ranks.clear()
+        if notify:
+            for listener in self.listeners:
+                listener()
+
+    async def page_count(self):
+        if self._page_count is None:
+            pages = math.ceil(await database.count_users() / self.page_size)
+            self._page_count = min(max(1, pages), self.max_pages)
+        return self._page_count
+
+    async def page(self, page_number):
+        """Return the rendered table for a 1-based page number."""
+        page_number = min(page_number, self.max_pages)
+        if page_number not in self._pages:
+            known = max(page for page in self._boundaries if page < page_number)
+            rows = await database.find_top_users(
+                self._boundaries[known], (page_number - 1 - known) * self.page_size, self.page_size
+            )
+            if rows:
+                self._boundaries[page_number] = (rows[-1].get("Wins"), rows[-1]["user_id"])
+            self._pages[page_number] = render_table(rows, (page_number - 1) * self.page_size + 1)
+        return self._pages[page_number]
+
+    async def rank_of(self, user_id):
+        """Return (rank, wins) for a user, or None if they have no profile.
+
+        The rank is the user's row number in the table, so ties on Wins are
+        ordered by user_id there too. Cached with the pages until the next
+        invalidate().
+        """
+        if user_id not in self._ranks:
+            user = await database.find_user(user_id, {"_id": 0, "user_id": 1, "Wins": 1})
+            if not user:
+                return None
+            wins = user.get("Wins")
+            rank = await database.count_users_ranked_before((wins, user_id)) + 1
+            self._ranks[user_id] = (rank, wins or 0)
+        return self._ranks[user_id]
+
+
+leaderboard = Leaderboard()
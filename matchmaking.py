@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import os
+import time
+from collections import deque
+
+
+# Rating used for pairing: "points" or "winrate".
+MATCH_BY = os.getenv("MATCH_BY", "points")
+# mode: (starting window, growth per second waited, widest window)
+MATCH_WINDOWS = {
+    "points": (10, 2.0, 200),
+    "winrate": (0.05, 0.01, 0.5)
+}
+QUEUE_TTL = 600.0
+SWEEP_INTERVAL = 1.0
+WAIT_SAMPLES = 1000
+
+
+def win_rate(wins, losses):
+    """Share of battles won; players with no battles count as even."""
+    played = wins + losses
+    return wins / played if played else 0.5
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class QueueEntry:
+    __slots__ = ("user_id", "rating", "joined_at", "channel_id")
+
+    def __init__(self, user_id, rating, joined_at, channel_id):
+        self.user_id = user_id
+        self.rating = rating
+        self.joined_at = joined_at
+        self.channel_id = channel_id
+
+    def __repr__(self):
+        return f"QueueEntry({self.user_id!r}, {self.rating!r})"
+
+    @property
+    def key(self):
+        return (self.rating, self.joined_at, self.user_id)
+
+
+class MatchmakingQueue:
+    """Players waiting for a battle, kept sorted by rating.
+
+    A player joining is compared against their nearest neighbours by
+    bisection. Everyone else is paired by a periodic sweep over adjacent
+    entries. The rating gap a player accepts widens the longer they wait.
+    The queue is local to this process.
+    """
+
+    def __init__(self, mode=MATCH_BY, ttl=QUEUE_TTL):
+        self.mode = mode
+        self.start_window, self.growth, self.max_window = MATCH_WINDOWS[mode]
+        self.ttl = ttl
+        self._sorted = []
+        self._entries = {}
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._sweep_task = None
+        self.matched_count = 0
+        self.expired_count = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id):
+        return user_id in self._entries
+
+    def rating(self, profile):
+        if self.mode == "winrate":
+            return win_rate(profile.wins, profile.losses)
+        return profile.points
+
+    def window(self, entry, now):
+        return min(self.max_window, self.start_window + self.growth * (now - entry.joined_at))
+
+    def _remove(self, entry):
+        del self._sorted[bisect.bisect_left(self._sorted, entry.key)]
+        del self._entries[entry.user_id]
+
+    def _matched(self, first, second, now):
+        """Record a pair's wait times; the player who waited longer goes first as the challenger."""
+        self._waits.append(now - first.joined_at)
+        self._waits.append(now - second.joined_at)
+        self.matched_count += 1
+        return (first, second) if first.joined_at <= second.joined_at else (second, first)
+
+    def join(self, user_id, rating, channel_id, now=None):
+        """Queue a player, or return the (waiting, joining) pair if someone in range is already waiting.
+
+        A player who is already queued keeps their original entry and gets None.
+        """
+        if user_id in self._entries:
+            return None
+        now = time.monotonic() if now is None else now
+        entry = QueueEntry(user_id, rating, now, channel_id)
+        position = bisect.bisect_left(self._sorted, entry.key)
+
+        best = None
+        for neighbour_position in (position - 1, position):
+            if 0 <= neighbour_position < len(self._sorted):
+                neighbour = self._entries[self._sorted[neighbour_position][2]]
+                gap = abs(neighbour.rating - rating)
+                if gap <= self.window(neighbour, now) and (best is None or gap < best[0]):
+                    best = (gap, neighbour)
+
+        if best is not None:
+            self._remove(best[1])
+            return self._matched(best[1], entry, now)
+
+        self._sorted.insert(position, entry.key)
+        self._entries[user_id] = entry
+        return None
+
+    def leave(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return False
+        self._remove(entry)
+        return True
+
+    def sweep(self, now=None):
+        """Pair adjacent players whose gap fits the wider of their windows and drop stale entries.
+
+        Returns (pairs, expired).
+        """
+        now = time.monotonic() if now is None else now
+        pairs, expired, remaining = [], [], []
+        i = 0
+        while i < len(self._sorted):
+            entry = self._entries[self._sorted[i][2]]
+            if now - entry.joined_at > self.ttl:
+                expired.append(entry)
+                i += 1
+                continue
+            if i + 1 < len(self._sorted):
+                other = self._entries[self._sorted[i + 1][2]]
+                gap = other.rating - entry.rating
+                if now - other.joined_at <= self.ttl and gap <= max(self.window(entry, now), self.window(other, now)):
+                    pairs.append(self._matched(entry, other, now))
+                    i += 2
+                    continue
+            remaining.append(self._sorted[i])
+            i += 1
+
+        self._sorted = remaining
+        for entry in expired:
+            del self._entries[entry.user_id]
+        for first, second in pairs:
+            del self._entries[first.user_id]
+            del self._entries[second.user_id]
+        self.expired_count += len(expired)
+        return pairs, expired
+
+    def wait_percentiles(self):
+        """p50/p90/p99 seconds waited by recently matched players."""
+        waits = sorted(self._waits)
+        if not waits:
+            return {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+        return {name: percentile(waits, fraction) for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))}
+
+    async def _sweep_forever(self, interval, on_match, on_expired):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                pairs, expired = self.sweep()
+            except Exception as e:
+                print(f"Error sweeping the matchmaking queue: {e}")
+                continue
+            if pairs:
+                asyncio.ensure_future(on_match(pairs))
+            if expired and on_expired:
+                asyncio.ensure_future(on_expired(expired))
+
+    def start(self, on_match, on_expired=None, interval=SWEEP_INTERVAL):
+        """Start the background sweep (no-op if it is already running)."""
+        if self._sweep_task is None or self._sweep_task.done():
+            self._sweep_task = asyncio.create_task(self._sweep_forever(interval, on_match, on_expired))
+
+    def stop(self):
+        if self._sweep_task is not None:
+            self._sweep_task.cancel()
+            self._sweep_task = None
+
+    def stats(self):
+        return {
+            "waiting": len(self._entries),
+            "matched": self.matched_count,
+            "expired": self.expired_count,
+            **self.wait_percentiles()
+        }
+
+
+matchmaking_queue = MatchmakingQueue()
@@ -0,0 +1,125 @@
+import asyncio
+import bisect
+from pymongo import monitoring
+
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOOP_LAG_INTERVAL = 0.5
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and two adds."""
+
+    __slots__ = ("buckets", "counts", "total", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}le="+Inf"}} {self.count}')
+        suffix = f"{{{labels.rstrip(',')}}}" if labels else ""
+        lines.append(f"{name}_sum{suffix} {self.total}")
+        lines.append(f"{name}_count{suffix} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Process-wide metrics registry, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.command_latency = {}
+        self.mongo_latency = {}
+        self.loop_lag = Histogram()
+        self.counters = {}
+        self._collectors = {}
+        self._lag_task = None
+
+    def observe_command(self, command, seconds):
+        histogram = self.command_latency.get(command)
+        if histogram is None:
+            histogram = self.command_latency[command] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_mongo(self, operation, seconds):
+        histogram = self.mongo_latency.get(operation)
+        if histogram is None:
+            histogram = self.mongo_latency[operation] = Histogram()
+        histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register(self, name, collect, kind="gauge"):
+        """Expose a value read at scrape time, e.g. the number of active battles."""
+        self._collectors[name] = (collect, kind)
+
+    async def _sample_loop_lag(self, interval):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            self.loop_lag.observe(max(0.0, loop.time() - expected))
+
+    def start(self, interval=LOOP_LAG_INTERVAL):
+        if self._lag_task is None or self._lag_task.done():
+            self._lag_task = asyncio.create_task(self._sample_loop_lag(interval))
+
+    def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            self._lag_task = None
+
+    def render(self):
+        lines = ["# TYPE sarangi_command_latency_seconds histogram"]
+        for command, histogram in list(self.command_latency.items()):
+            lines += histogram.render("sarangi_command_latency_seconds", f'command="{command}",')
+
+        lines.append("# TYPE sarangi_mongo_latency_seconds histogram")
+        for operation, histogram in list(self.mongo_latency.items()):
+            lines += histogram.render("sarangi_mongo_latency_seconds", f'operation="{operation}",')
+
+        lines.append("# TYPE sarangi_event_loop_lag_seconds histogram")
+        lines += self.loop_lag.render("sarangi_event_loop_lag_seconds")
+
+        for name, value in list(self.counters.items()):
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {value}")
+
+        for name, (collect, kind) in list(self._collectors.items()):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {collect()}")
+
+        return "\n".join(lines) + "\n"
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times every Mongo command round-trip via pymongo's command monitoring."""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.registry.observe_mongo(event.command_name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        self.registry.observe_mongo(event.command_name, event.duration_micros / 1e6)
+        self.registry.inc("sarangi_mongo_errors_total")
+
+
+metrics = Metrics()
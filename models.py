@@ -0,0 +1,80 @@
+# Stat names players type, mapped to the field each one is stored under in card documents.
+STAT_FIELDS = {
+    "rating": "rating",
+    "apps": "APPS",
+    "agr": "agr",
+    "sv": "SV",
+    "g/a": "G/A",
+    "tw": "TW"
+}
+
+ROUNDS = 5
+
+
+def challenger_wins_round(stat_a, stat_b):
+    """Round rule shared by live battles and the simulator.
+
+    User A must strictly beat User B's value, so ties go to User B. Works
+    elementwise on NumPy arrays as well as on single values.
+    """
+    return stat_a > stat_b
+
+
+def stat_number(value):
+    """Numeric value of a stored stat; missing or "N/A" stats count as 0."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class Card:
+    """A card document decoded once, with numeric stats and its display line precomputed."""
+
+    __slots__ = ("id", "name", "key", "price", "image_url", "stats", "display_line", "document")
+
+    def __init__(self, document):
+        self.document = document
+        self.id = document.get("_id")
+        self.name = document.get("name", "Unknown Card")
+        self.key = self.name.lower()
+        self.price = document.get("price", 0)
+        self.image_url = document.get("image_url")
+        self.stats = {stat: stat_number(document.get(field)) for stat, field in STAT_FIELDS.items()}
+        self.display_line = (
+            f"{self.name} - {document.get('rating', 'N/A')} rating, {document.get('APPS', 'N/A')} apps, "
+            f"{document.get('agr', 'N/A')} agr, {document.get('SV', 'N/A')} SV, "
+            f"{document.get('G/A', 'N/A')} G/A, {document.get('TW', 'N/A')} TW"
+        )
+
+    def __repr__(self):
+        return f"Card({self.name!r})"
+
+    def stat(self, name):
+        """Look up a stat by the name a player typed, in any case."""
+        return self.stats.get(name.lower(), 0.0)
+
+    @classmethod
+    def from_documents(cls, documents):
+        return [cls(document) for document in documents]
+
+
+class UserProfile:
+    """A user document decoded once at load time."""
+
+    __slots__ = ("user_id", "name", "points", "wins", "losses", "cards")
+
+    def __init__(self, document):
+        self.user_id = document["user_id"]
+        self.name = document.get("name", "Unknown")
+        self.points = document.get("points", 0)
+        self.wins = document.get("Wins", 0)
+        self.losses = document.get("Losses", 0)
+        self.cards = Card.from_documents(document.get("cards", []))
+
+    def __repr__(self):
+        return f"UserProfile({self.user_id!r}, {self.name!r})"
+
+    @classmethod
+    def from_document(cls, document):
+        return None if document is None else cls(document)
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+import time
+from collections import OrderedDict
+from discord.ext import commands
+
+
+# (capacity, tokens refilled per second)
+USER_LIMIT = (5, 0.5)
+GUILD_LIMIT = (30, 5.0)
+# Commands that fan out into many Mongo reads or DMs cost more than one token.
+COMMAND_COSTS = {"team": 3, "battlestats": 2}
+MAX_BUCKETS = 100000
+
+
+class RateLimited(commands.CheckFailure):
+    def __init__(self, scope, retry_after, warn):
+        super().__init__(f"Rate limited by {scope}; retry in {retry_after:.1f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+        self.warn = warn
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated", "warned")
+
+    def __init__(self, capacity, now):
+        self.tokens = capacity
+        self.updated = now
+        self.warned = False
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by id, kept in an LRU so idle keys are eventually dropped."""
+
+    def __init__(self, capacity, rate, max_buckets=MAX_BUCKETS):
+        self.capacity = capacity
+        self.rate = rate
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+
+    def _bucket(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.capacity, now)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.tokens = min(self.capacity, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+
+    def available(self, key, cost, now):
+        return self._bucket(key, now).tokens >= cost
+
+    def take(self, key, cost, now):
+        """Spend `cost` tokens; returns None on success or the seconds until they would be available."""
+        bucket = self._bucket(key, now)
+        if bucket.tokens >= cost:
+            bucket.tokens -= cost
+            bucket.warned = False
+            return None
+        return (cost - bucket.tokens) / self.rate
+
+    def first_warning(self, key):
+        """True the first time a key is refused since it last succeeded."""
+        bucket = self._buckets.get(key)
+        if bucket is None or bucket.warned:
+            return False
+        bucket.warned = True
+        return True
+
+
+class CommandRateLimiter:
+    """Per-user and per-guild limits applied to every command through a global check."""
+
+    def __init__(self, user_limit=USER_LIMIT, guild_limit=GUILD_LIMIT, costs=COMMAND_COSTS):
+        self.users = TokenBucketLimiter(*user_limit)
+        self.guilds = TokenBucketLimiter(*guild_limit)
+        self.costs = costs
+        self.shed_count = {"user": 0, "guild": 0}
+
+    def check(self, ctx):
+        cost = self.costs.get(ctx.command.qualified_name, 1)
+        now = time.monotonic()
+        user_key = ctx.author.id
+        guild_key = ctx.guild.id if ctx.guild else None
+
+        # Only spend from either bucket once both can afford it.
+        if guild_key is not None and not self.guilds.available(guild_key, cost, now):
+            self.shed_count["guild"] += 1
+            retry_after = self.guilds.take(guild_key, cost, now)
+            raise RateLimited("guild", retry_after, self.guilds.first_warning(guild_key))
+
+        retry_after = self.users.take(user_key, cost, now)
+        if retry_after is not None:
+            self.shed_count["user"] += 1
+            raise RateLimited("user", retry_after, self.users.first_warning(user_key))
+
+        if guild_key is not None:
+            self.guilds.take(guild_key, cost, now)
+        return True
+
+
+class Coalescer:
+    """Shares one in-flight call between identical concurrent requests."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.coalesced_count = 0
+
+    async def run(self, key, factory):
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced_count += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(factory())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+
+command_limiter = CommandRateLimiter()
+coalescer = Coalescer()
+
+
+def coalesced(func):
+    """Command decorator: repeat calls from the same user in the same channel with the same arguments join the call in flight.
+
+    The channel is part of the key because the shared call only replies to the first ctx.
+    """
+    @functools.wraps(func)
+    async def wrapper(ctx, *args, **kwargs):
+        key = (func.__name__, ctx.author.id, ctx.channel.id, args, tuple(sorted(kwargs.items())))
+        return await coalescer.run(key, lambda: func(ctx, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,165 @@
+"""Rebuild user points, wins and losses from the event log.
+
+Events are streamed one at a time from the capped Mongo collection or a
+JSONL log (plus its rotated backups, oldest first), so only the per-user
+totals are held in memory. Points only count what the log saw: sells and
+battle wins.
+
+The log is lossy by design (the capped collection drops its oldest events
+and JSONL rotation deletes old backups), so --backfill only writes when the
+log still starts with its log_start marker. Even then the log only covers
+activity since event logging was switched on; --force overrides the check.
+
+Examples:
+    python replay.py                          # replay the Mongo events collection
+    python replay.py --jsonl events.jsonl     # replay a JSONL log and its backups
+    python replay.py --audit                  # compare the totals with the users collection
+    python replay.py --backfill               # write the totals back, if the log is complete
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import time
+from pymongo import UpdateOne
+import database
+from eventlog import LOG_START
+
+
+BATCH_SIZE = 5000
+FIELDS = ("points", "Wins", "Losses")
+
+
+def log_files(path):
+    """The log and its rotated backups, oldest first."""
+    backups = []
+    for name in glob.glob(f"{glob.escape(path)}.*"):
+        suffix = name[len(path) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), name))
+    return [name for _, name in sorted(backups, reverse=True)] + ([path] if os.path.exists(path) else [])
+
+
+async def jsonl_events(path):
+    for name in log_files(path):
+        with open(name) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+async def mongo_events(batch_size):
+    async for event in database.stream_events(batch_size):
+        yield event
+
+
+class Replay:
+    """Per-user totals folded from events in log order."""
+
+    def __init__(self):
+        self.totals = {}
+        self.event_counts = {}
+        # True once the oldest replayed event turns out to be the log_start marker.
+        self.complete = None
+
+    def _user(self, user_id):
+        totals = self.totals.get(user_id)
+        if totals is None:
+            totals = self.totals[user_id] = dict.fromkeys(FIELDS, 0)
+        return totals
+
+    def apply(self, event):
+        event_type = event.get("type")
+        if self.complete is None:
+            self.complete = event_type == LOG_START
+        self.event_counts[event_type] = self.event_counts.get(event_type, 0) + 1
+        if event_type == "sell":
+            self._user(event["user_id"])["points"] += event.get("points", 0)
+        elif event_type == "result" and event.get("winner"):
+            winner = self._user(event["winner"])
+            winner["points"] += event.get("points", 0)
+            winner["Wins"] += 1
+            self._user(event["loser"])["Losses"] += 1
+
+    async def run(self, events):
+        async for event in events:
+            self.apply(event)
+        return self
+
+
+async def audit(replay, batch_size, limit):
+    """Print users whose stored totals differ from the replayed ones."""
+    mismatches = 0
+    async for user in database.stream_users({"user_id": 1, **dict.fromkeys(FIELDS, 1)}, batch_size):
+        expected = replay.totals.get(user["user_id"], dict.fromkeys(FIELDS, 0))
+        stored = {field: user.get(field, 0) for field in FIELDS}
+        if stored != expected:
+            mismatches += 1
+            if mismatches <= limit:
+                print(f"  {user['user_id']}: stored {stored}, replayed {expected}")
+    print(f"{mismatches} users differ from the event log.")
+
+
+async def backfill(replay, batch_size):
+    """Overwrite each replayed user's totals, batch_size updates at a time."""
+    operations = []
+    written = 0
+    for user_id, totals in replay.totals.items():
+        operations.append(UpdateOne({"user_id": user_id}, {"$set": totals}))
+        if len(operations) >= batch_size:
+            await database.write_user_results(operations)
+            written += len(operations)
+            operations = []
+    if operations:
+        await database.write_user_results(operations)
+        written += len(operations)
+    print(f"Backfilled {written} users.")
+
+
+async def main(args):
+    if args.jsonl:
+        events = jsonl_events(args.jsonl)
+    else:
+        database.connect()
+        events = mongo_events(args.batch_size)
+
+    start = time.perf_counter()
+    replay = await Replay().run(events)
+    elapsed = time.perf_counter() - start
+    processed = sum(replay.event_counts.values())
+    print(f"Replayed {processed:,} events for {len(replay.totals):,} users in {elapsed:.2f}s")
+    for event_type, count in sorted(replay.event_counts.items(), key=str):
+        print(f"  {event_type}: {count:,}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(replay.totals, f, indent=2)
+        print(f"Saved totals to {args.output}")
+
+    if args.audit or args.backfill:
+        database.connect()
+        if args.audit:
+            await audit(replay, args.batch_size, args.limit)
+        if args.backfill:
+            if replay.complete or args.force:
+                await backfill(replay, args.batch_size)
+            else:
+                print(
+                    "Not backfilling: the log no longer starts with its log_start marker, so older "
+                    "events have been dropped and the totals would overwrite real history. "
+                    "Use --audit to review, or --force to write anyway."
+                )
+                raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild user points and wins from the event log.")
+    parser.add_argument("--jsonl", help="replay this JSONL log (and its rotated backups) instead of MongoDB")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--audit", action="store_true", help="compare replayed totals with the users collection")
+    parser.add_argument("--limit", type=int, default=20, help="mismatches to print when auditing")
+    parser.add_argument("--backfill", action="store_true", help="write replayed totals to the users collection")
+    parser.add_argument("--force", action="store_true", help="backfill even if the log is incomplete")
+    parser.add_argument("--output", help="write the replayed totals as JSON")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,57 @@
+from pymongo import UpdateOne
+import database
+from buffered import BufferedWriter
+from leaderboard import leaderboard
+
+
+FLUSH_INTERVAL = 1.0
+MAX_BATCH = 500
+WIN_POINTS = 5
+
+
+class ResultWriter(BufferedWriter):
+    """Collects `$inc` updates for battle results and writes them as unordered bulk batches.
+
+    Increments for the same user are merged between flushes, so a burst of
+    results costs one bulk_write per batch instead of one update per player.
+    """
+
+    description = "battle results"
+
+    def __init__(self, flush_interval=FLUSH_INTERVAL, max_batch=MAX_BATCH):
+        super().__init__(flush_interval, max_batch)
+        self._pending = {}
+
+    def _merge(self, user_id, increments):
+        pending = self._pending.setdefault(user_id, {})
+        for field, amount in increments.items():
+            pending[field] = pending.get(field, 0) + amount
+
+    def record(self, user_id, **increments):
+        """Queue increments such as points=5 or Wins=1 for a user."""
+        self._merge(user_id, increments)
+        self._buffered()
+
+    def record_battle(self, winner_id, loser_id):
+        self.record(winner_id, points=WIN_POINTS, Wins=1)
+        self.record(loser_id, Losses=1)
+
+    def _take_batch(self):
+        batch = dict(list(self._pending.items())[:self.max_pending])
+        for user_id in batch:
+            del self._pending[user_id]
+        return batch
+
+    async def _write(self, batch):
+        await database.write_user_results([
+            UpdateOne({"user_id": user_id}, {"$inc": increments})
+            for user_id, increments in batch.items()
+        ])
+        leaderboard.invalidate()
+
+    def _restore(self, batch):
+        for user_id, increments in batch.items():
+            self._merge(user_id, increments)
+
+
+result_writer = ResultWriter()
@@ -0,0 +1,172 @@
+"""Offline card-balancing engine.
+
+Simulates large numbers of battles with random hands in vectorised NumPy batches
+and reports win probabilities per card and per stat. Rounds are scored with
+the same `challenger_wins_round` rule as live battles.
+
+Needs NumPy, which the bot itself does not. Examples:
+    python simulation.py --battles 1000000
+    python simulation.py --catalog-json cards.json --output balance.json
+"""
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+import database
+from models import ROUNDS, STAT_FIELDS, Card, challenger_wins_round
+
+
+STATS = list(STAT_FIELDS)
+BATCH_SIZE = 250000
+
+
+def stat_matrix(cards):
+    """(cards x stats) float32 matrix of the normalised stat values."""
+    return np.array([[card.stats[stat] for stat in STATS] for card in cards], dtype=np.float32).reshape(len(cards), len(STATS))
+
+
+def simulate(stats, battles, batch_size=BATCH_SIZE, seed=None):
+    """Play `battles` random battles and return raw win/appearance counts.
+
+    Each player gets ROUNDS cards drawn uniformly from the catalog and plays
+    one per round in random order. The challenger picks a stat uniformly at
+    random each round.
+    """
+    rng = np.random.default_rng(seed)
+    card_count, stat_count = stats.shape
+
+    counts = {
+        "card_rounds": np.zeros(card_count),
+        "card_round_wins": np.zeros(card_count),
+        "card_battle_wins": np.zeros(card_count),
+        "stat_rounds": np.zeros(stat_count),
+        "stat_challenger_wins": np.zeros(stat_count),
+        "stat_ties": np.zeros(stat_count),
+        "challenger_battle_wins": 0,
+        "draws": 0,
+        "battles": battles
+    }
+
+    remaining = battles
+    while remaining:
+        size = min(batch_size, remaining)
+        remaining -= size
+
+        hand_a = rng.integers(0, card_count, (size, ROUNDS)).ravel()
+        hand_b = rng.integers(0, card_count, (size, ROUNDS)).ravel()
+        chosen = rng.integers(0, stat_count, (size, ROUNDS)).ravel()
+
+        value_a = stats[hand_a, chosen]
+        value_b = stats[hand_b, chosen]
+        a_wins = challenger_wins_round(value_a, value_b)
+
+        a_score = a_wins.reshape(size, ROUNDS).sum(axis=1)
+        a_won = np.repeat(a_score * 2 > ROUNDS, ROUNDS)
+        b_won = np.repeat(a_score * 2 < ROUNDS, ROUNDS)
+
+        counts["card_rounds"] += np.bincount(hand_a, minlength=card_count) + np.bincount(hand_b, minlength=card_count)
+        counts["card_round_wins"] += (
+            np.bincount(hand_a, weights=a_wins, minlength=card_count)
+            + np.bincount(hand_b, weights=~a_wins, minlength=card_count)
+        )
+        counts["card_battle_wins"] += (
+            np.bincount(hand_a, weights=a_won, minlength=card_count)
+            + np.bincount(hand_b, weights=b_won, minlength=card_count)
+        )
+        counts["stat_rounds"] += np.bincount(chosen, minlength=stat_count)
+        counts["stat_challenger_wins"] += np.bincount(chosen, weights=a_wins, minlength=stat_count)
+        counts["stat_ties"] += np.bincount(chosen, weights=value_a == value_b, minlength=stat_count)
+        counts["challenger_battle_wins"] += int((a_score * 2 > ROUNDS).sum())
+        counts["draws"] += int((a_score * 2 == ROUNDS).sum())
+
+    return counts
+
+
+def balance_report(cards, counts):
+    """Turn raw counts into per-card and per-stat win probabilities."""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        round_win_rate = counts["card_round_wins"] / counts["card_rounds"]
+        battle_win_rate = counts["card_battle_wins"] / counts["card_rounds"]
+        stat_win_rate = counts["stat_challenger_wins"] / counts["stat_rounds"]
+        stat_tie_rate = counts["stat_ties"] / counts["stat_rounds"]
+
+    def rate(value):
+        return None if np.isnan(value) else round(float(value), 4)
+
+    return {
+        "battles": counts["battles"],
+        "challenger_win_rate": round(counts["challenger_battle_wins"] / counts["battles"], 4),
+        "draw_rate": round(counts["draws"] / counts["battles"], 4),
+        "stats": [
+            {"stat": stat, "challenger_win_rate": rate(stat_win_rate[i]), "tie_rate": rate(stat_tie_rate[i])}
+            for i, stat in enumerate(STATS)
+        ],
+        "cards": sorted(
+            (
+                {
+                    "id": str(card.id),
+                    "name": card.name,
+                    "appearances": int(counts["card_rounds"][i]),
+                    "round_win_rate": rate(round_win_rate[i]),
+                    "battle_win_rate": rate(battle_win_rate[i])
+                }
+                for i, card in enumerate(cards)
+            ),
+            key=lambda card: card["battle_win_rate"] or 0,
+            reverse=True
+        )
+    }
+
+
+async def load_catalog(include_owned):
+    database.connect()
+    documents = await database.find_available_cards()
+    if include_owned:
+        documents += await database.find_owned_cards()
+    return Card.from_documents(documents)
+
+
+def main(args):
+    if args.catalog_json:
+        with open(args.catalog_json) as f:
+            cards = Card.from_documents(json.load(f))
+    else:
+        cards = asyncio.run(load_catalog(args.include_owned))
+    if not cards:
+        print("No cards to simulate.")
+        return
+
+    start = time.perf_counter()
+    counts = simulate(stat_matrix(cards), args.battles, args.batch_size, args.seed)
+    elapsed = time.perf_counter() - start
+    report = balance_report(cards, counts)
+    report["seconds"] = round(elapsed, 3)
+
+    print(f"Simulated {args.battles:,} battles over {len(cards)} cards in {elapsed:.2f}s")
+    print(f"Challenger win rate: {report['challenger_win_rate']:.2%} (ties go to User B)")
+    for stat in report["stats"]:
+        print(f"  {stat['stat']:>6}: challenger wins {stat['challenger_win_rate']:.2%}, ties {stat['tie_rate']:.2%}")
+    print("Strongest cards:")
+    for card in report["cards"][:args.top]:
+        print(f"  {card['name']:<30} {card['battle_win_rate']:.2%}")
+    print("Weakest cards:")
+    for card in report["cards"][-args.top:]:
+        print(f"  {card['name']:<30} {card['battle_win_rate']:.2%}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved report to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate random battles to check card balance.")
+    parser.add_argument("--battles", type=int, default=1000000)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--catalog-json", help="JSON list of card documents instead of reading MongoDB")
+    parser.add_argument("--include-owned", action="store_true", help="also simulate cards already owned by users")
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="write the full report as JSON")
+    main(parser.parse_args())
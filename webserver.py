@@ -0,0 +1,70 @@
+import os
+from aiohttp import web
+from metrics import metrics
+
+
+HOST = "0.0.0.0"
+PORT = int(os.getenv('PORT', 5000))
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class StatusServer:
+    """Health and metrics endpoints served by aiohttp on the bot's own event loop."""
+
+    def __init__(self, is_ready, host=HOST, port=PORT):
+        self.is_ready = is_ready
+        self.host = host
+        self.port = port
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get('/', self.home)
+        self.app.router.add_get('/metrics', self.metrics)
+        self.app.router.add_get('/healthz', self.healthz)
+
+    async def home(self, request):
+        return web.Response(text="Discord Bot is Running!")
+
+    async def metrics(self, request):
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    async def healthz(self, request):
+        if self.is_ready():
+            return web.Response(text="ok")
+        return web.Response(text="starting", status=503)
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        print(f"Status server listening on {self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def create_flask_app(is_ready):
+    """Same endpoints as a Flask app, for hosting behind a WSGI server; Flask is imported only here."""
+    from flask import Flask, Response
+
+    app = Flask(__name__)
+
+    @app.route('/')
+    def home():
+        return "Discord Bot is Running!"
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype=METRICS_CONTENT_TYPE)
+
+    @app.route('/healthz')
+    def healthz():
+        if is_ready():
+            return "ok"
+        return "starting", 503
+
+    return app